@@ -3,6 +3,17 @@ ASGI config for ecommerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Async views such as products.views.verify_khalti run natively here
+instead of in a per-request event loop, so serve production traffic
+through an ASGI server, e.g. ``uvicorn ecommerce.asgi:application``.
+They only wait on the network without holding a thread while every
+middleware in settings.MIDDLEWARE is async-capable; a sync-only one
+makes Django run the whole request through a sync adapter.
+
+``application`` also handles the ASGI lifespan protocol, which Django
+doesn't: startup opens the Khalti client the process's verifications
+share and shutdown closes it.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,4 +24,25 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'ecommerce.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from products import payments  # noqa: E402 (needs the app registry)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await payments.open_client()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await payments.close_client()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+    else:
+        await django_application(scope, receive, send)
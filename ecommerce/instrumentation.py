@@ -0,0 +1,195 @@
+# ecommerce/instrumentation.py
+#
+# Per-request database and template timing. Every database connection
+# carries an execute_wrapper hook that, while QueryInstrumentationMiddleware
+# is handling a request, records each query's time and fingerprint: its
+# SQL with literals and IN-list lengths normalised, so
+# the same query issued once per row of a loop shows up as one
+# fingerprint with a high count (an N+1). Template time comes from
+# InstrumentedDjangoTemplates, the template backend in settings. The
+# request is found through a ContextVar rather than by wrapping the
+# connections per request, because under ASGI sync views run in another
+# thread with that thread's connections.
+#
+# The totals go out as a Server-Timing header, which browser dev tools
+# show in the network panel, and as one JSON log line per request on the
+# 'ecommerce.instrumentation' logger. Requests that repeat a fingerprint
+# QUERY_REPEAT_THRESHOLD times or more are logged at WARNING, except for
+# transaction control: every nested atomic() block issues the same
+# SAVEPOINT and RELEASE SAVEPOINT, which is not an N+1. A streaming
+# response's body runs after the middleware returns, so its figures only
+# cover the view and carry "streaming": true.
+
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger(__name__)
+
+_metrics = ContextVar('request_metrics', default=None)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_SAVEPOINT = re.compile(r'"s\d+_x\d+"')
+_SPACE = re.compile(r'\s+')
+_TRANSACTION_CONTROL = re.compile(r'(?:BEGIN|COMMIT|ROLLBACK|SAVEPOINT|RELEASE)\b', re.IGNORECASE)
+
+
+def fingerprint(sql):
+    """``sql`` with literals replaced, so repeats of a query compare equal."""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    sql = _SAVEPOINT.sub('"s?"', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        self.fingerprints = Counter()
+
+    def repeated(self, threshold):
+        """[(fingerprint, count)] for queries issued ``threshold`` times or more.
+
+        Transaction control statements are left out.
+        """
+        return [
+            (sql, count) for sql, count in self.fingerprints.most_common()
+            if count >= threshold and not _TRANSACTION_CONTROL.match(sql)
+        ]
+
+    def __call__(self, execute, sql, params, many, context):
+        # connection.execute_wrapper() hook
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+
+def current_metrics():
+    """The RequestMetrics of the request being handled, if any."""
+    return _metrics.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install(connection, **kwargs):
+    """Add the recording hook to ``connection`` (a connection_created receiver)."""
+    # First in the list, as connection.execute_wrapper() pops the last one
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _record_query)
+
+
+connection_created.connect(install, dispatch_uid='ecommerce.instrumentation.install')
+
+
+class InstrumentedTemplate(Template):
+    def render(self, context=None, request=None):
+        metrics = _metrics.get()
+        if metrics is None:
+            return super().render(context, request)
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates whose templates add their render time to the request."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return InstrumentedTemplate(super().get_template(template_name).template, self)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class QueryInstrumentationMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Connections opened before this module was imported missed the signal
+        for connection in connections.all(initialized_only=True):
+            install(connection)
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _metrics.reset(token)
+        return self.finish(request, response, metrics, time.perf_counter() - start)
+
+    def finish(self, request, response, metrics, total):
+        # Template time includes queries run by lazy querysets in templates
+        streamed = ' before streaming' if response.streaming else ''
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={_ms(metrics.db_time)};desc="{metrics.queries} queries{streamed}"',
+            f'tpl;dur={_ms(metrics.template_time)}',
+            f'app;dur={_ms(total)}',
+        ])
+        self.log(request, response, metrics, total)
+        return response
+
+    def log(self, request, response, metrics, total):
+        match = request.resolver_match
+        repeated = metrics.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        record = {
+            'method': request.method,
+            'path': request.path,
+            'url_name': match.view_name if match else None,
+            'status': response.status_code,
+            'queries': metrics.queries,
+            'db_ms': _ms(metrics.db_time),
+            'template_ms': _ms(metrics.template_time),
+            'total_ms': _ms(total),
+        }
+        if response.streaming:
+            record['streaming'] = True
+        if repeated:
+            record['repeated_queries'] = [{'sql': sql, 'count': count} for sql, count in repeated]
+        logger.log(logging.WARNING if repeated else logging.INFO, json.dumps(record), extra={'request_metrics': record})
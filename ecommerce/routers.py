@@ -0,0 +1,144 @@
+# ecommerce/routers.py
+#
+# Sends catalog and order-history reads to the read replicas listed in
+# settings.DATABASE_REPLICAS. Everything else, all writes, and any read
+# inside a transaction go to the primary.
+#
+# Replicas lag behind the primary, so a user who has just written
+# (added to the cart, checked out, reviewed) must read from the primary
+# for a while to see that write. ReplicaPinMiddleware handles this per
+# request: unsafe requests are pinned from the start, any request that
+# writes pins its remaining reads, and either one sets a short-lived
+# cookie that pins the user's next requests for REPLICA_PIN_SECONDS.
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Models whose reads can tolerate replication lag
+REPLICA_MODELS = {
+    'products.category',
+    'products.product',
+    'products.productimage',
+    'products.productneighbor',
+    'products.review',
+    'products.verifiedpurchase',
+    'products.order',
+    'products.orderitem',
+    'products.dailysalesrollup',
+}
+
+PIN_COOKIE = 'db_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class PinState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+# None outside a request; see ReplicaRouter.db_for_write
+_pin_state = ContextVar('db_pin_state', default=None)
+
+
+def pin_to_primary():
+    """Send the rest of this request's (or thread's) reads to the primary."""
+    state = _pin_state.get()
+    if state is None:
+        state = PinState()
+        _pin_state.set(state)
+    state.pinned = state.wrote = True
+
+
+@contextmanager
+def primary_reads():
+    """Read from the primary inside the block, without pinning afterwards."""
+    state = PinState(pinned=True)
+    token = _pin_state.set(state)
+    try:
+        yield
+    finally:
+        _pin_state.reset(token)
+        if state.wrote:
+            pin_to_primary()
+
+
+def is_pinned():
+    state = _pin_state.get()
+    return state is not None and state.pinned
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas or model._meta.label_lower not in REPLICA_MODELS:
+            return None
+        if is_pinned() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == DEFAULT_DB_ALIAS:
+            # Related objects of a row read from the primary
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        # Called before the write runs, so later reads see it
+        pin_to_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary; leave any other
+        # database to the default same-database rule
+        pool = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema by replication
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaPinMiddleware:
+    async_capable = True
+    sync_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state = self.pin_state(request)
+        token = _pin_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _pin_state.reset(token)
+        return self.set_pin_cookie(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.pin_state(request)
+        token = _pin_state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _pin_state.reset(token)
+        return self.set_pin_cookie(request, response, state)
+
+    def pin_state(self, request):
+        return PinState(request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES)
+
+    def set_pin_cookie(self, request, response, state):
+        if state.wrote or request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
@@ -10,6 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import atexit
+import os
+import shutil
+import sys
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,20 +49,23 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ecommerce.instrumentation.QueryInstrumentationMiddleware',
+    'ecommerce.routers.ReplicaPinMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'whitenoise.middleware.WhiteNoiseMiddleware',
+    'ecommerce.static.WhiteNoiseMiddleware',
 ]
 
 ROOT_URLCONF = 'ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to the request metrics
+        'BACKEND': 'ecommerce.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -77,13 +85,97 @@ WSGI_APPLICATION = 'ecommerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# ecommerce.sqlite applies WAL, synchronous=NORMAL, mmap, cache and
+# busy_timeout PRAGMAs on every connection (see ecommerce/sqlite/base.py);
+# `manage.py benchmark_sqlite` compares it with the stock settings.
+# WAL is stored in the database file, so db.sqlite3 is not tracked; the
+# sample data ships as demo.sqlite3 and is copied into place (README).
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'ecommerce.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Take the write lock at BEGIN, so concurrent checkouts queue
+            # on busy_timeout instead of failing mid-transaction
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # Keep connections (and their page cache) between requests
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        # File-backed test database so threaded tests share real locking
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Read replicas. Catalog and order-history reads go to a random replica
+# (ecommerce/routers.py); writes, transactions and users who wrote in the
+# last REPLICA_PIN_SECONDS use the primary. REPLICA_DB_NAME points at a
+# replicated copy of the primary database; any alias other than 'default'
+# added here counts as a replica.
+if os.environ.get('REPLICA_DB_NAME'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['REPLICA_DB_NAME'],
+        # Tests read the test database through the replica alias
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['ecommerce.routers.ReplicaRouter']
+
+# Longer than the worst replication lag we expect
+REPLICA_PIN_SECONDS = 5
+
+
+
+# Request instrumentation (ecommerce/instrumentation.py): query count,
+# DB and template time go out as a Server-Timing header and a JSON log
+# line per request. Requests that run one query fingerprint this many
+# times or more (an N+1) are logged at WARNING.
+QUERY_REPEAT_THRESHOLD = 5
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'ecommerce.instrumentation': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
+if sys.argv[1:2] == ['test']:
+    # Keep per-request lines out of test output; assertLogs() still
+    # captures them, and N+1 warnings still show
+    LOGGING['loggers']['ecommerce.instrumentation']['level'] = 'WARNING'
+
+
+# Cache
+# Catalog sections are cached under a version key (products/cache.py),
+# which every worker process must see, so the default backend is a
+# directory shared by the processes on this host (CACHE_DIR). Use
+# Redis/Memcached when the workers span several hosts.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('CACHE_DIR', BASE_DIR / 'cache'),
+        'OPTIONS': {'MAX_ENTRIES': 1000},
     }
 }
 
+if sys.argv[1:2] == ['test']:
+    # A fresh directory per run, so no entries survive from the last one
+    CACHES['default']['LOCATION'] = tempfile.mkdtemp(prefix='ecommerce-test-cache-')
+    atexit.register(shutil.rmtree, CACHES['default']['LOCATION'], ignore_errors=True)
+
+# Versioned catalog entries are replaced when the version moves, but the
+# file backend's incr() isn't atomic across processes and a bump can be
+# lost, so entries still expire
+CATALOG_CACHE_TIMEOUT = 300
 
 
 # Password validation
@@ -153,6 +245,24 @@ LOGOUT_REDIRECT_URL = 'homepage'
 # Khalti Configuration
 KHALTI_SECRET_KEY = "your_secret_key_here"
 KHALTI_PUBLIC_KEY = "your_public_key_here"
-
-# Email Configuration - Development (prints to console)
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+KHALTI_VERIFY_URL = "https://khalti.com/api/v2/payment/verify/"
+KHALTI_TIMEOUT = 10  # seconds per attempt
+KHALTI_CONNECT_TIMEOUT = 3
+KHALTI_VERIFY_RETRIES = 2  # extra attempts on timeouts and 5xx responses
+KHALTI_RETRY_BACKOFF = 0.5  # seconds, doubled on every retry
+# A Pending token older than this was left by a request that died; a
+# retry may take it over. Longer than a full round of retries.
+KHALTI_CLAIM_TIMEOUT = 120  # seconds
+
+# Shown to the customer's banking app in the order payment QR
+PAYMENT_QR_MERCHANT = "Sandesh Electronics"
+PAYMENT_PROOF_MAX_SIZE = 5 * 1024 * 1024  # bytes
+
+# Email Configuration
+# Requests only queue mail in the outbox table; `manage.py run_outbox`
+# delivers it through OUTBOX_DELIVERY_BACKEND.
+EMAIL_BACKEND = 'products.outbox.OutboxEmailBackend'
+# Development (prints to console)
+OUTBOX_DELIVERY_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+OUTBOX_MAX_ATTEMPTS = 5  # then the message is marked Dead
+OUTBOX_RETRY_BACKOFF = 60  # seconds, doubled on every failed attempt
@@ -0,0 +1,43 @@
+# ecommerce/sqlite/base.py
+#
+# SQLite engine tuned for a web server: ENGINE = 'ecommerce.sqlite'.
+# Every new connection gets the PRAGMAs below, merged with any given in
+# OPTIONS['pragmas']. WAL lets readers run alongside the single writer,
+# and busy_timeout makes writers queue for the lock instead of failing
+# with "database is locked". Pair it with OPTIONS['transaction_mode'] =
+# 'IMMEDIATE' so a transaction takes the write lock when it begins rather
+# than failing when it first writes.
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    # Durable across application crashes; a power loss may drop the
+    # last commits but never corrupts the database in WAL mode.
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,  # milliseconds
+    'cache_size': -64000,  # KiB, i.e. about 64 MB per connection
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def apply_pragmas(connection, pragmas):
+    for name, value in pragmas.items():
+        connection.execute(f'PRAGMA {name} = {value}')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        self.pragmas = {**DEFAULT_PRAGMAS, **kwargs.pop('pragmas', {})}
+        return kwargs
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        pragmas = self.pragmas
+        if self.is_in_memory_db():
+            # Neither applies to in-memory databases
+            pragmas = {k: v for k, v in pragmas.items() if k not in ('journal_mode', 'mmap_size')}
+        apply_pragmas(conn, pragmas)
+        return conn
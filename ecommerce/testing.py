@@ -0,0 +1,44 @@
+# ecommerce/testing.py
+#
+# Test helpers shared by the apps' test suites.
+
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.urls import reverse
+
+from .instrumentation import RequestMetrics
+
+
+class QueryBudgetMixin:
+    """assertQueryBudget() for TestCase subclasses with a test client.
+
+    Budgets are per URL name so that a view which starts issuing a query
+    per row (or just more queries) fails its test with the offending SQL
+    fingerprints in the message. They include on-commit callbacks and the
+    body of streaming responses, which a real request also pays for.
+    """
+
+    def assertQueryBudget(self, url_name, budget, args=None, kwargs=None, method='get', data=None,
+                          status=200):
+        url = reverse(url_name, args=args, kwargs=kwargs)
+        metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            stack.enter_context(self.captureOnCommitCallbacks(execute=True))
+            response = getattr(self.client, method)(url, data)
+            if response.streaming:
+                # Produce the body here so its queries count, and keep it readable
+                response.streaming_content = [b''.join(response.streaming_content)]
+        self.assertEqual(response.status_code, status, f"{method.upper()} {url}")
+
+        repeated = metrics.repeated(settings.QUERY_REPEAT_THRESHOLD)
+        details = '\n'.join(f'{count}x {sql}' for sql, count in metrics.fingerprints.most_common())
+        self.assertFalse(repeated, f"{url_name} repeats queries (N+1?):\n{details}")
+        self.assertLessEqual(
+            metrics.queries, budget,
+            f"{url_name} ran {metrics.queries} queries, budget {budget}:\n{details}",
+        )
+        return response
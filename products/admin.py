@@ -1,5 +1,36 @@
 from django.contrib import admin
-from .models import Category, Product, Review, CartItem, Wishlist, Order
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .models import (
+    Category, Product, Review, CartItem, Wishlist, Order, OutboundEmail, DailySalesRollup, PaymentVerification,
+)
+from .exports import export_response
+from .pagination import EstimatedCountPaginator
+from .rollups import sales_dashboard
+from .search import search_product_ids
+
+ADMIN_SEARCH_LIMIT = 1000
+
+
+class FastChangelistMixin:
+    """Changelist settings for tables that grow large.
+
+    No exact COUNT(*) (estimated paginator, no "N total" count) and, on
+    the changelist only, a projection of the columns it displays. Pair
+    with list_select_related for any related column in list_display.
+    """
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_only = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        match = request.resolver_match
+        # Change forms need every field, so only project the list view
+        if self.list_only and match and match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*self.list_only)
+        return queryset
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -7,30 +38,127 @@ class CategoryAdmin(admin.ModelAdmin):
     
 
 @admin.register(Product)
-class ProductAdmin(admin.ModelAdmin):
+class ProductAdmin(FastChangelistMixin, admin.ModelAdmin):
     list_display = ('name', 'category', 'price', 'stock', 'created_at')
+    list_select_related = ('category',)
+    list_only = ('name', 'category__name', 'price', 'stock', 'created_at')
     list_filter = ('category', 'created_at')
     search_fields = ('name', 'description')
     prepopulated_fields = {'slug': ('name',)}
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains table scans
+        if not search_term:
+            return queryset, False
+        ids = search_product_ids(search_term, limit=ADMIN_SEARCH_LIMIT)
+        return queryset.filter(id__in=ids), False
+
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(FastChangelistMixin, admin.ModelAdmin):
     list_display = ('product', 'user', 'rating', 'created_at')
     list_filter = ('rating', 'created_at')
-    search_fields = ('product__name', 'user__username', 'comment')
+    list_select_related = ('product', 'user')
+    list_only = ('product__name', 'user__username', 'rating', 'created_at')
+    # Prefix matches only; a substring search over comments scans the table
+    search_fields = ('^product__name', '^user__username')
 
 
 
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ('user', 'product')
+    list_select_related = ('user', 'product')
 
 
 
-class OrderAdmin(admin.ModelAdmin):
+class OrderAdmin(FastChangelistMixin, admin.ModelAdmin):
     list_display = ['id', 'user', 'total_price', 'status', 'created_at']
     list_filter = ['status', 'created_at']
-    search_fields = ['user__username']
+    list_select_related = ['user']
+    list_only = ['user__username', 'total_price', 'status', 'created_at']
+    search_fields = ['^user__username', '=id', '=payment_proof_sha256']
+    search_help_text = "Order number, proof SHA-256 or the start of a username."
+    actions = ['export_csv']
+
+    def get_search_results(self, request, queryset, search_term):
+        # Route each kind of term to one indexed lookup instead of OR-ing
+        # LIKE clauses across the joined user table.
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+        if len(term) == 64 and all(char in '0123456789abcdef' for char in term.lower()):
+            return queryset.filter(payment_proof_sha256=term.lower()), False
+        user_ids = list(
+            User.objects.filter(username__istartswith=term).values_list('pk', flat=True)[:ADMIN_SEARCH_LIMIT]
+        )
+        return queryset.filter(user_id__in=user_ids), False
+
+    @admin.action(description="Export selected orders with their items as CSV")
+    def export_csv(self, request, queryset):
+        stamp = timezone.localtime().strftime('%Y%m%d-%H%M')
+        return export_response(queryset, filename=f'orders-{stamp}.csv')
 
 admin.site.register(Order, OrderAdmin)
+
+
+@admin.register(DailySalesRollup)
+class DailySalesRollupAdmin(admin.ModelAdmin):
+    """Sales dashboard. Reads only the rollup table, never orders."""
+    change_list_template = 'admin/products/dailysalesrollup/sales_dashboard.html'
+    list_display = ('date', 'category', 'status', 'revenue', 'units', 'order_count')
+    list_filter = ('status', 'category', 'date')
+    list_select_related = ('category',)
+
+    # Rollups are derived data: rebuild them with rebuild_sales_rollups
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        changelist = getattr(response, 'context_data', {}).get('cl')
+        if changelist is not None:
+            # Charts follow the changelist's filters
+            response.context_data.update(sales_dashboard(changelist.queryset))
+        return response
+
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at')
+    list_filter = ('status',)
+    readonly_fields = ('sent_at', 'last_error', 'lease_token')
+    actions = ['retry']
+
+    @admin.action(description="Retry selected emails")
+    def retry(self, request, queryset):
+        retried = queryset.exclude(status='Sent').update(
+            status='Pending', attempts=0, next_attempt_at=timezone.now(), lease_token='',
+        )
+        self.message_user(request, f"{retried} emails queued for delivery.")
+
+
+@admin.register(PaymentVerification)
+class PaymentVerificationAdmin(admin.ModelAdmin):
+    """Khalti tokens. Filter on Unfulfilled for payments that need a refund."""
+    list_display = ('token', 'user', 'amount', 'status', 'order', 'error', 'updated_at')
+    list_filter = ('status',)
+    list_select_related = ('user', 'order')
+    search_fields = ('=token',)
+    readonly_fields = ('token', 'user', 'amount', 'order', 'error', 'created_at', 'updated_at')
+    actions = ['mark_refunded']
+
+    @admin.action(description="Mark selected payments as refunded")
+    def mark_refunded(self, request, queryset):
+        refunded = queryset.filter(status='Unfulfilled').update(status='Refunded', updated_at=timezone.now())
+        self.message_user(request, f"{refunded} payments marked as refunded.")
+
+
 admin.site.register(CartItem)
\ No newline at end of file
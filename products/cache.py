@@ -0,0 +1,62 @@
+# products/cache.py
+#
+# Versioned cache for catalog data. Every cached entry embeds the current
+# catalog version in its key; saving or deleting a Product, Category or
+# Review bumps the version, so stale entries are simply never read again
+# and age out of the cache on their own. The version lives in the shared
+# cache backend (settings.CACHES), so every worker sees a bump, and
+# entries expire after CATALOG_CACHE_TIMEOUT in case one is lost.
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from ecommerce.routers import primary_reads
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def _initial_version():
+    # Millisecond clock rather than 1, so a version key that was evicted
+    # never restarts below a number that is still present in old keys.
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _initial_version(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        # Key missing (first write or evicted): start a fresh version
+        version = _initial_version()
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+        return version
+
+
+def catalog_cache_key(name):
+    return f'catalog:{get_catalog_version()}:{name}'
+
+
+def cached(name, build):
+    """Return ``build()``, cached under the current catalog version."""
+    key = catalog_cache_key(name)
+    value = cache.get(key)
+    if value is None:
+        # Entries outlive replication lag, so a lagging replica must not fill them
+        with primary_reads():
+            value = build()
+        cache.set(key, value, timeout=settings.CATALOG_CACHE_TIMEOUT)
+    return value
+
+
+def cached_section(name, build):
+    """Return ``build()`` evaluated to a list, cached under the catalog version."""
+    return cached(name, lambda: list(build()))
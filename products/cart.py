@@ -0,0 +1,74 @@
+# products/cart.py
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum
+
+from .inventory import with_available_stock
+from .models import CartItem
+
+CENTS = Decimal('0.01')
+
+
+class CartService:
+    """Cart reads and writes for one user.
+
+    Quantity changes are single UPDATE statements with F() expressions, so
+    concurrent requests (double-clicks, several tabs) never lose updates.
+    """
+
+    def __init__(self, user):
+        self.user = user
+
+    def _lines(self):
+        return CartItem.objects.filter(user=self.user)
+
+    def items(self):
+        """Cart lines with their products and available stock, in one query."""
+        lines = self._lines().select_related('product').order_by('id')
+        return with_available_stock(lines, user=self.user, product_path='product__')
+
+    def total(self):
+        """Cart total computed by the database."""
+        total = self._lines().aggregate(
+            total=Sum(F('quantity') * F('product__price'),
+                      output_field=DecimalField(max_digits=12, decimal_places=2))
+        )['total']
+        # SQLite hands back computed decimals unscaled
+        return (total or Decimal(0)).quantize(CENTS)
+
+    def add(self, product, quantity=1):
+        """Add ``quantity`` of ``product``, creating the line if needed."""
+        line = self._lines().filter(product=product)
+        if line.update(quantity=F('quantity') + quantity):
+            return
+        try:
+            with transaction.atomic():
+                CartItem.objects.create(user=self.user, product=product, quantity=quantity)
+        except IntegrityError:
+            # Another request inserted the line first; the unique
+            # (user, product) constraint sends us back to the increment.
+            line.update(quantity=F('quantity') + quantity)
+
+    def change_quantity(self, item_id, delta):
+        """Adjust a line by ``delta`` without dropping below 1.
+
+        Returns the new quantity, or None if nothing changed. Raises
+        CartItem.DoesNotExist if the line is not in this cart.
+        """
+        line = self._lines().filter(id=item_id)
+        updated = line.filter(quantity__gt=-delta).update(quantity=F('quantity') + delta)
+        quantity = line.values_list('quantity', flat=True).get()
+        return quantity if updated else None
+
+    def remove(self, item_id):
+        deleted, _ = self._lines().filter(id=item_id).delete()
+        return deleted
+
+    def remove_many(self, item_ids):
+        deleted, _ = self._lines().filter(id__in=item_ids).delete()
+        return deleted
+
+    def clear(self):
+        self._lines().delete()
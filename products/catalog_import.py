@@ -0,0 +1,165 @@
+# products/catalog_import.py
+#
+# Bulk catalog import from CSV or JSON Lines. Rows are streamed from the
+# file, validated, and written in batches with a single INSERT ... ON
+# CONFLICT(slug) DO UPDATE each, so a large import never holds more than
+# one batch in memory and costs a handful of queries per batch.
+#
+# Columns: name, category, price, stock, and optionally description,
+# image and slug. ``category`` may be a category slug or name; unknown
+# categories are created. Rows with a slug update the product with that
+# slug (or create it); rows without one always create a new product
+# with a freshly allocated unique slug.
+
+import csv
+import json
+from dataclasses import dataclass
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Category, Product
+from .slugs import SlugAllocator, unique_slug
+
+UPDATE_FIELDS = ['category', 'name', 'price', 'stock', 'updated_at']
+# Only overwritten on update when the row provides them
+OPTIONAL_FIELDS = ['description', 'image']
+
+
+class ImportRowError(ValueError):
+    pass
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    written: int = 0
+    errors: int = 0
+
+
+def read_rows(path, file_format=None):
+    """Yield ``(line_number, row_dict)`` from a CSV or JSONL file.
+
+    A JSONL line that isn't valid JSON is yielded as its raw text, so the
+    importer reports it as a bad row instead of stopping.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+    with open(path, newline='', encoding='utf-8') as source:
+        if file_format == 'csv':
+            reader = csv.DictReader(source)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(source, 1):
+                if line.strip():
+                    try:
+                        yield line_number, json.loads(line)
+                    except ValueError:
+                        yield line_number, line
+
+
+class CategoryResolver:
+    """Maps category slugs and names to ids from one query."""
+
+    def __init__(self):
+        self.ids = {}
+        for category in Category.objects.only('id', 'name', 'slug'):
+            self.ids.setdefault(category.slug, category.id)
+            self.ids.setdefault(category.name.lower(), category.id)
+
+    def resolve(self, value):
+        key = str(value or '').strip()
+        if not key:
+            raise ImportRowError("category is required")
+        category_id = self.ids.get(key) or self.ids.get(key.lower())
+        if category_id is None:
+            category = Category.objects.create(name=key, slug=unique_slug(Category.objects, key))
+            category_id = self.ids[key.lower()] = self.ids[category.slug] = category.id
+        return category_id
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = CategoryResolver()
+        self.slugs = SlugAllocator(Product.objects.values_list('slug', flat=True).iterator())
+        self.image_default = Product._meta.get_field('image').default
+        self.price_field = Product._meta.get_field('price')
+        self.stock_field = Product._meta.get_field('stock')
+        self.slug_field = Product._meta.get_field('slug')
+        self.result = ImportResult()
+
+    def clean(self, field, value):
+        # The model field's own checks, so NaN, infinities and values the
+        # column can't hold fail here rather than in the batch INSERT
+        try:
+            return field.clean(value, None)
+        except ValidationError as exc:
+            raise ImportRowError(f"{field.name}: {' '.join(exc.messages)}")
+
+    def build_product(self, row, now):
+        if not isinstance(row, dict):
+            raise ImportRowError("each row must be a JSON object")
+        name = str(row.get('name') or '').strip()
+        if not name:
+            raise ImportRowError("name is required")
+        price = self.clean(self.price_field, str(row.get('price', '')).strip())
+        stock = self.clean(self.stock_field, row.get('stock') or 0)
+        if price < 0:
+            raise ImportRowError("price must not be negative")
+
+        provided = tuple(field for field in OPTIONAL_FIELDS if row.get(field))
+        slug = str(row.get('slug') or '').strip()
+        if slug:
+            # Product URLs only match valid slugs
+            slug = self.clean(self.slug_field, slug)
+            self.slugs.reserve(slug)
+        else:
+            slug = self.slugs.allocate(name)
+        return provided, Product(
+            category_id=self.categories.resolve(row.get('category')),
+            name=name,
+            slug=slug,
+            description=row.get('description') or '',
+            price=price,
+            stock=stock,
+            image=row.get('image') or self.image_default,
+            updated_at=now,
+        )
+
+    def write(self, batch):
+        # A slug may appear twice in one batch; the later row wins, as it
+        # would across batches.
+        latest = {product.slug: (provided, product) for provided, product in batch}
+        groups = {}
+        for provided, product in latest.values():
+            groups.setdefault(provided, []).append(product)
+        with transaction.atomic():
+            for provided, products in groups.items():
+                Product.objects.bulk_create(
+                    products,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=UPDATE_FIELDS + list(provided),
+                )
+        self.result.written += len(latest)
+
+    def run(self, rows, on_error=None):
+        batch = []
+        now = timezone.now()
+        for line_number, row in rows:
+            self.result.rows += 1
+            try:
+                batch.append(self.build_product(row, now))
+            except ImportRowError as exc:
+                self.result.errors += 1
+                if on_error:
+                    on_error(line_number, exc)
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+        return self.result
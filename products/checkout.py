@@ -0,0 +1,71 @@
+# products/checkout.py
+
+from django.db import transaction
+from django.db.models import F
+
+from .cache import bump_catalog_version
+from .cart import CartService
+from .inventory import held_quantity, release_holds
+from .models import CartItem, OrderItem, Product
+from .rollups import record_order
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__("Your cart is empty.")
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Sorry, {product.name} does not have enough stock left.")
+
+
+def place_order(order):
+    """Turn ``order.user``'s cart into ``order`` and its OrderItems.
+
+    ``order`` is an unsaved Order with its delivery details filled in.
+    Stock is decremented with one conditional UPDATE per line, so two
+    buyers can never both take the last unit, and units held by other
+    shoppers (products.inventory) are left alone. If any line is short the
+    whole checkout rolls back. Prices are snapshotted into OrderItem.
+    """
+    with transaction.atomic():
+        # Read the cart under the write lock (transactions BEGIN
+        # IMMEDIATE), so a second submit of the same cart sees it emptied
+        # by the first instead of ordering the same lines again.
+        lines = sorted(CartService(order.user).items(), key=lambda line: line.product_id)
+        if not lines:
+            raise EmptyCartError()
+        for line in lines:
+            held_by_others = held_quantity(line.product_id, exclude_user=order.user)
+            updated = Product.objects.filter(
+                id=line.product_id, stock__gte=held_by_others + line.quantity
+            ).update(stock=F('stock') - line.quantity)
+            if not updated:
+                raise OutOfStockError(line.product)
+        # The UPDATEs above fire no post_save, so nothing else tells the
+        # cached in-stock facets that a product just sold out
+        product_ids = [line.product_id for line in lines]
+        if Product.objects.filter(id__in=product_ids, stock=0).exists():
+            transaction.on_commit(bump_catalog_version)
+
+        order.total_price = sum(line.product.price * line.quantity for line in lines)
+        order.save()
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.product_id,
+                quantity=line.quantity,
+                price=line.product.price,
+            )
+            for line in lines
+        ])
+        CartItem.objects.filter(id__in=[line.id for line in lines]).delete()
+        release_holds(order.user, product_ids)
+        record_order(order, lines)
+    return order
@@ -0,0 +1,83 @@
+# products/facets.py
+#
+# Facet counts for the category listing, computed in a single grouped
+# query over categories and cached under the catalog version.
+#
+# Facets are disjunctive: the category counts honour the price and stock
+# filters but not the selected category, and the price histogram honours
+# the category and stock filters but not the selected price range, so
+# every option shows how many products picking it would return.
+
+from django.db.models import Count, Q
+
+from .cache import cached
+from .models import Category
+
+# Price histogram buckets in rupees: [low, high), the last one open-ended
+PRICE_BUCKETS = [
+    (0, 5000),
+    (5000, 20000),
+    (20000, 50000),
+    (50000, 100000),
+    (100000, None),
+]
+
+
+def _bucket_filter(low, high):
+    condition = Q(products__price__gte=low)
+    if high is not None:
+        condition &= Q(products__price__lt=high)
+    return condition
+
+
+def _bucket_label(low, high):
+    if high is None:
+        return f"Rs. {low:,}+"
+    return f"Rs. {low:,} - {high:,}"
+
+
+def build_facets(category_id=None, min_price=None, max_price=None, in_stock=False):
+    price_filter = Q()
+    if min_price is not None:
+        price_filter &= Q(products__price__gte=min_price)
+    if max_price is not None:
+        price_filter &= Q(products__price__lte=max_price)
+    stock_filter = Q(products__stock__gt=0) if in_stock else Q()
+
+    annotations = {
+        'product_count': Count('products', filter=price_filter & stock_filter),
+        'in_stock_count': Count('products', filter=price_filter & Q(products__stock__gt=0)),
+    }
+    for index, (low, high) in enumerate(PRICE_BUCKETS):
+        annotations[f'bucket_{index}'] = Count(
+            'products', filter=_bucket_filter(low, high) & stock_filter
+        )
+    categories = list(Category.objects.annotate(**annotations).order_by('name'))
+
+    selected = [c for c in categories if category_id is None or c.id == category_id]
+    bucket_counts = [
+        sum(getattr(c, f'bucket_{index}') for c in selected)
+        for index in range(len(PRICE_BUCKETS))
+    ]
+    largest = max(bucket_counts, default=0) or 1
+    price_buckets = [
+        {
+            'min_price': low,
+            # Filter links use an inclusive max, so stop just below the next bucket
+            'max_price': None if high is None else f'{high - 0.01:.2f}',
+            'label': _bucket_label(low, high),
+            'count': count,
+            'percent': round(100 * count / largest),
+        }
+        for (low, high), count in zip(PRICE_BUCKETS, bucket_counts)
+    ]
+    return {
+        'categories': categories,
+        'price_buckets': price_buckets,
+        'in_stock_count': sum(c.in_stock_count for c in selected),
+    }
+
+
+def catalog_facets(category_id=None, min_price=None, max_price=None, in_stock=False):
+    key = f'facets:{category_id}:{min_price}:{max_price}:{int(in_stock)}'
+    return cached(key, lambda: build_facets(category_id, min_price, max_price, in_stock))
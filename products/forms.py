@@ -20,3 +20,24 @@ class ReviewForm(forms.ModelForm):
     class Meta:
         model = Review
         fields = ['rating', 'comment']
+
+class ProductFilterForm(forms.Form):
+    SORT_CHOICES = [
+        ('newest', 'Newest first'),
+        ('price', 'Price: low to high'),
+        ('-price', 'Price: high to low'),
+    ]
+
+    category = forms.IntegerField(required=False, min_value=1)
+    min_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+    max_price = forms.DecimalField(required=False, min_value=0, max_digits=10, decimal_places=2)
+    in_stock = forms.BooleanField(required=False)
+    sort = forms.ChoiceField(choices=SORT_CHOICES, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        min_price = cleaned_data.get('min_price')
+        max_price = cleaned_data.get('max_price')
+        if min_price is not None and max_price is not None and min_price > max_price:
+            self.add_error('max_price', "Max price must be greater than min price.")
+        return cleaned_data
@@ -0,0 +1,106 @@
+# products/inventory.py
+#
+# Short-lived stock holds for checkout. Reaching the checkout page holds
+# the cart quantities for INVENTORY_HOLD_MINUTES; other shoppers see
+# ``stock - active holds`` as available, and checkout only succeeds if
+# the stock left after everyone else's holds covers the order. The
+# Product row itself is never locked while the customer pays.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Product, StockHold
+
+
+def hold_ttl():
+    return timedelta(minutes=getattr(settings, 'INVENTORY_HOLD_MINUTES', 15))
+
+
+def held_quantity(product, exclude_user=None):
+    """Expression: units of ``product`` under active holds.
+
+    ``product`` is a product id or an OuterRef. Uses the
+    (product, expires_at) index.
+    """
+    holds = StockHold.objects.filter(product=product, expires_at__gt=timezone.now())
+    if exclude_user is not None:
+        holds = holds.exclude(user=exclude_user)
+    total = holds.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def with_available_stock(queryset, user=None, product_path=''):
+    """Annotate ``available_stock``: stock minus other users' active holds.
+
+    ``product_path`` points at the product from the queryset's model,
+    e.g. ``'product__'`` for CartItem.
+    """
+    product_ref = f'{product_path}id' if product_path else 'id'
+    return queryset.annotate(
+        available_stock=F(f'{product_path}stock') - held_quantity(OuterRef(product_ref), exclude_user=user)
+    )
+
+
+def hold_cart(user, lines):
+    """Hold stock for the user's cart ``lines``.
+
+    Each line holds as much as is available, up to its quantity; holds for
+    products no longer in the cart are released. Availability is re-read
+    inside the transaction that writes the holds, with the products
+    locked, so two shoppers can never hold the same units. Each line's
+    ``available_stock`` is updated to that value. Returns the expiry time.
+    """
+    expires_at = timezone.now() + hold_ttl()
+    product_ids = sorted(line.product_id for line in lines)
+    with transaction.atomic():
+        # FOR UPDATE where supported; SQLite's IMMEDIATE transactions
+        # (see settings) already serialize writers
+        products = Product.objects.select_for_update().filter(id__in=product_ids).order_by('id')
+        available = dict(with_available_stock(products, user=user).values_list('id', 'available_stock'))
+        holds = []
+        for line in lines:
+            line.available_stock = available.get(line.product_id, 0)
+            if line.available_stock > 0:
+                holds.append(StockHold(
+                    user=user,
+                    product_id=line.product_id,
+                    quantity=min(line.quantity, line.available_stock),
+                    expires_at=expires_at,
+                ))
+        StockHold.objects.filter(user=user).exclude(
+            product_id__in=[hold.product_id for hold in holds]
+        ).delete()
+        StockHold.objects.bulk_create(
+            holds,
+            update_conflicts=True,
+            unique_fields=['user', 'product'],
+            update_fields=['quantity', 'expires_at'],
+        )
+    return expires_at
+
+
+def release_holds(user, product_ids=None):
+    holds = StockHold.objects.filter(user=user)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    holds.delete()
+
+
+def release_expired_holds(batch_size=1000):
+    """Delete expired holds in batches; returns how many were removed."""
+    now = timezone.now()
+    released = 0
+    while True:
+        batch = list(
+            StockHold.objects.filter(expires_at__lte=now)
+            .order_by('expires_at')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not batch:
+            return released
+        released += StockHold.objects.filter(id__in=batch).delete()[0]
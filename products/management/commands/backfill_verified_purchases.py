@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from products.reviews import backfill_verified_purchases
+
+
+class Command(BaseCommand):
+    help = "Record a verified purchase for every product in a delivered order."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        pairs = backfill_verified_purchases(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Checked {pairs} user/product pairs from delivered orders."))
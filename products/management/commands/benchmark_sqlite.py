@@ -0,0 +1,145 @@
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from ecommerce.sqlite.base import DEFAULT_PRAGMAS, apply_pragmas
+
+# How each profile opens connections and begins write transactions
+PROFILES = {
+    # Stock Django: rollback journal, deferred BEGIN, a connection per request
+    'stock': dict(pragmas={}, begin='BEGIN', persistent=False),
+    # ecommerce.sqlite with CONN_MAX_AGE and transaction_mode IMMEDIATE
+    'tuned': dict(pragmas=DEFAULT_PRAGMAS, begin='BEGIN IMMEDIATE', persistent=True),
+}
+
+
+def create_database(path, rows):
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE product (id INTEGER PRIMARY KEY, name TEXT, stock INTEGER, price REAL);
+        CREATE TABLE sale (id INTEGER PRIMARY KEY, product_id INTEGER, quantity INTEGER);
+        CREATE INDEX sale_product ON sale (product_id);
+    """)
+    conn.executemany(
+        'INSERT INTO product (id, name, stock, price) VALUES (?, ?, ?, ?)',
+        ((i, f'Product {i}', 1000, i % 500 + 0.99) for i in range(1, rows + 1)),
+    )
+    conn.commit()
+    conn.close()
+
+
+class Worker(threading.Thread):
+    def __init__(self, path, profile, rows, write_ratio, deadline, seed):
+        super().__init__()
+        self.path = path
+        self.profile = profile
+        self.rows = rows
+        self.write_ratio = write_ratio
+        self.deadline = deadline
+        self.random = random.Random(seed)
+        self.reads = self.writes = self.errors = 0
+
+    def connect(self):
+        # Django's default 5s lock timeout, in both profiles
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA foreign_keys = ON')
+        apply_pragmas(conn, self.profile['pragmas'])
+        return conn
+
+    def read(self, conn):
+        start = self.random.randint(1, self.rows)
+        conn.execute(
+            'SELECT id, name, price FROM product WHERE id BETWEEN ? AND ? ORDER BY id',
+            (start, start + 20),
+        ).fetchall()
+        conn.execute('SELECT COUNT(*) FROM sale WHERE product_id = ?', (start,)).fetchone()
+
+    def write(self, conn):
+        # Read-modify-write, like a checkout reserving stock
+        product_id = self.random.randint(1, self.rows)
+        conn.execute(self.profile['begin'])
+        try:
+            (stock,) = conn.execute('SELECT stock FROM product WHERE id = ?', (product_id,)).fetchone()
+            conn.execute('UPDATE product SET stock = ? WHERE id = ?', (stock - 1, product_id))
+            conn.execute('INSERT INTO sale (product_id, quantity) VALUES (?, 1)', (product_id,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def run(self):
+        conn = self.connect() if self.profile['persistent'] else None
+        while time.perf_counter() < self.deadline:
+            request_conn = conn or self.connect()
+            try:
+                if self.random.random() < self.write_ratio:
+                    self.write(request_conn)
+                    self.writes += 1
+                else:
+                    self.read(request_conn)
+                    self.reads += 1
+            except sqlite3.OperationalError:
+                # "database is locked": the request would have failed
+                self.errors += 1
+            finally:
+                if conn is None:
+                    request_conn.close()
+        if conn is not None:
+            conn.close()
+
+
+class Command(BaseCommand):
+    help = ("Compare stock SQLite settings with the ecommerce.sqlite engine "
+            "profile under a threaded mix of catalog reads and checkout-style "
+            "writes. Runs against scratch databases; the project database is "
+            "not touched.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0,
+                            help="Seconds to run each profile.")
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help="Fraction of operations that write.")
+        parser.add_argument('--rows', type=int, default=10000,
+                            help="Products in the scratch database.")
+
+    def run_profile(self, name, directory, options):
+        path = str(Path(directory) / f'{name}.sqlite3')
+        create_database(path, options['rows'])
+        profile = PROFILES[name]
+        deadline = time.perf_counter() + options['duration']
+        workers = [
+            Worker(path, profile, options['rows'], options['write_ratio'], deadline, seed)
+            for seed in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+        reads = sum(w.reads for w in workers)
+        writes = sum(w.writes for w in workers)
+        errors = sum(w.errors for w in workers)
+        self.stdout.write(
+            f"{name:>6}: {(reads + writes) / elapsed:9.0f} ops/s "
+            f"({reads / elapsed:.0f} reads/s, {writes / elapsed:.0f} writes/s), "
+            f"{errors} locked errors"
+        )
+        return (reads + writes) / elapsed
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{options['threads']} threads, {options['write_ratio']:.0%} writes, "
+            f"{options['duration']:g}s per profile"
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            stock = self.run_profile('stock', directory, options)
+            tuned = self.run_profile('tuned', directory, options)
+        if stock:
+            self.stdout.write(self.style.SUCCESS(f"Tuned profile: {tuned / stock:.1f}x stock throughput."))
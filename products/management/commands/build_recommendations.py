@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.recommendations import build_neighbors, store_neighbors
+
+
+class Command(BaseCommand):
+    help = "Rebuild the co-purchase ProductNeighbor table used for homepage recommendations."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top-k', type=int, default=20,
+                            help="Neighbours kept per product (default 20).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        neighbors = build_neighbors(top_k=options['top_k'])
+        store_neighbors(neighbors, batch_size=options['batch_size'])
+        elapsed = time.monotonic() - started
+        products = len({neighbor.product_id for neighbor in neighbors})
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {len(neighbors)} neighbours for {products} products in {elapsed:.1f}s."
+        ))
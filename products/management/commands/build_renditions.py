@@ -0,0 +1,128 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+
+from products.models import PendingRendition
+from products.renditions import refresh_renditions
+
+# (model, image field) pairs whose files get renditions
+IMAGE_FIELDS = [
+    ('products.Product', 'image'),
+    ('products.ProductImage', 'image'),
+    ('products.UserProfile', 'profile_picture'),
+    ('users.UserProfile', 'profile_picture'),
+]
+
+
+def _init_worker():
+    # Spawned workers start with a fresh interpreter; forked ones are
+    # already set up and this is a no-op.
+    django.setup()
+
+
+def _refresh(task):
+    source_name, force, only_missing = task
+    try:
+        status, size = refresh_renditions(source_name, force=force, only_missing=only_missing)
+    except Exception as exc:
+        return source_name, 'failed', 0, repr(exc)
+    return source_name, status, size, ''
+
+
+class Command(BaseCommand):
+    help = ("Create or refresh image renditions for every product, gallery and "
+            "profile image, in parallel. Images whose manifest matches the "
+            "current source and sizes are skipped, so an interrupted run can "
+            "simply be restarted. Saving a product or gallery image queues it; "
+            "run --pending --interval N as a worker to build the queue.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Worker processes (default: one per CPU).")
+        parser.add_argument('--chunk-size', type=int, default=16,
+                            help="Images handed to a worker at a time.")
+        parser.add_argument('--force', action='store_true',
+                            help="Regenerate even when renditions are current.")
+        parser.add_argument('--missing', action='store_true',
+                            help="Only build images without renditions; don't reread the others.")
+        parser.add_argument('--pending', action='store_true',
+                            help="Only build images queued by saves, then clear them from the queue.")
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep building every N seconds instead of exiting.")
+
+    def source_names(self):
+        names = set()
+        for label, field in IMAGE_FIELDS:
+            model = apps.get_model(label)
+            names.update(
+                model.objects.exclude(**{f'{field}__isnull': True})
+                .exclude(**{field: ''})
+                .values_list(field, flat=True)
+                .iterator()
+            )
+        return sorted(names)
+
+    def pending_names(self):
+        return sorted(PendingRendition.objects.values_list('source_name', flat=True))
+
+    def default_names(self):
+        """Field defaults such as products/images/default.png.
+
+        Often never uploaded, so a missing one is not worth reporting.
+        """
+        return {
+            apps.get_model(label)._meta.get_field(field).get_default()
+            for label, field in IMAGE_FIELDS
+        }
+
+    def handle(self, *args, **options):
+        while True:
+            self.build(options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def build(self, options):
+        # Names queued after this point stay queued for the next run
+        started_at = timezone.now()
+        names = self.pending_names() if options['pending'] else self.source_names()
+        if options['pending'] and not names:
+            return
+        defaults = self.default_names()
+        total = len(names)
+        self.stdout.write(f"Checking {total} images with {options['workers']} workers...")
+        # Workers never touch the database; don't let them inherit sockets
+        connections.close_all()
+
+        counts = {'generated': 0, 'skipped': 0, 'missing': 0, 'failed': 0}
+        read_bytes = 0
+        started = time.perf_counter()
+        tasks = ((name, options['force'], options['missing']) for name in names)
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+            results = pool.map(_refresh, tasks, chunksize=options['chunk_size'])
+            for done, (name, status, size, error) in enumerate(results, 1):
+                counts[status] += 1
+                read_bytes += size
+                if status == 'failed' or (status == 'missing' and name not in defaults):
+                    self.stderr.write(f"{status}: {name} {error}".rstrip())
+                if done % 1000 == 0:
+                    elapsed = time.perf_counter() - started
+                    self.stdout.write(f"{done}/{total} ({done / elapsed:.1f} images/s)")
+
+        if options['pending']:
+            # Failures are reported above rather than retried forever
+            PendingRendition.objects.filter(queued_at__lte=started_at).delete()
+
+        elapsed = time.perf_counter() - started
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {counts['generated']}, skipped {counts['skipped']}, "
+            f"missing {counts['missing']}, failed {counts['failed']} in {elapsed:.1f}s "
+            f"({rate:.1f} images/s, {read_bytes / elapsed / 2**20 if elapsed else 0:.1f} MiB/s read)."
+        ))
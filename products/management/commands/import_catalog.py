@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from products.cache import bump_catalog_version
+from products.catalog_import import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = ("Import or update products from a CSV or JSON Lines file. Rows with a "
+            "slug update that product; rows without one create a new product.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help="Input format (default: from the file extension).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        def report_error(line_number, exc):
+            self.stderr.write(f"line {line_number}: {exc}")
+
+        started = time.monotonic()
+        importer = CatalogImporter(batch_size=options['batch_size'])
+        try:
+            result = importer.run(read_rows(options['path'], options['format']), on_error=report_error)
+        except (OSError, ValueError) as exc:
+            raise CommandError(f"Could not read {options['path']}: {exc}")
+        # bulk_create skips the post_save signals that normally do this
+        bump_catalog_version()
+
+        elapsed = time.monotonic() - started
+        rate = result.rows / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result.written} products from {result.rows} rows "
+            f"({result.errors} rejected) in {elapsed:.1f}s, {rate:.0f} rows/s."
+        ))
+        if result.written:
+            self.stdout.write("Run build_renditions to create image renditions for new images.")
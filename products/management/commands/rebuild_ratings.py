@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+
+from products.cache import bump_catalog_version
+from products.models import Product, Review, normalize_rating_stats, rating_aggregates
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized rating columns on every product from its reviews."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = list(rating_aggregates())
+
+        # Products without reviews are reset in a single UPDATE
+        zeroed = Product.objects.exclude(
+            id__in=Review.objects.values('product_id')
+        ).update(**{field: 0 for field in fields})
+
+        rows = (
+            Review.objects.order_by()
+            .values('product_id')
+            .annotate(**rating_aggregates())
+        )
+        batch = []
+        updated = 0
+        for row in rows.iterator(chunk_size=batch_size):
+            product = Product(pk=row['product_id'], **normalize_rating_stats(row))
+            batch.append(product)
+            if len(batch) >= batch_size:
+                Product.objects.bulk_update(batch, fields)
+                updated += len(batch)
+                batch = []
+        if batch:
+            Product.objects.bulk_update(batch, fields)
+            updated += len(batch)
+        bump_catalog_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt ratings for {updated} reviewed products ({zeroed} without reviews)."
+        ))
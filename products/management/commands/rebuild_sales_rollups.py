@@ -0,0 +1,33 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from products.models import Order
+from products.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily sales rollups for a date range (default: all orders)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=datetime.date.fromisoformat,
+                            help="First date to rebuild (YYYY-MM-DD).")
+        parser.add_argument('--until', type=datetime.date.fromisoformat,
+                            help="Last date to rebuild (YYYY-MM-DD).")
+
+    def handle(self, *args, **options):
+        since, until = options['since'], options['until']
+        if since is None or until is None:
+            bounds = Order.objects.aggregate(first=Min('created_at'), last=Max('created_at'))
+            if bounds['first'] is None:
+                self.stdout.write("No orders to roll up.")
+                return
+            since = since or timezone.localdate(bounds['first'])
+            until = until or timezone.localdate(bounds['last'])
+        if since > until:
+            raise CommandError("--since must not be after --until.")
+
+        rows = rebuild_rollups(since, until)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} rollup rows for {since} to {until}."))
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.inventory import release_expired_holds
+
+
+class Command(BaseCommand):
+    help = "Delete expired checkout stock holds. Run periodically, e.g. from cron."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--interval', type=int, default=0,
+                            help="Keep sweeping every N seconds instead of exiting.")
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_holds(batch_size=options['batch_size'])
+            self.stdout.write(f"Released {released} expired holds.")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.outbox import deliver_batch
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', action='store_true',
+                            help="Keep running, polling for new mail.")
+        parser.add_argument('--interval', type=float, default=5,
+                            help="Seconds to sleep when the outbox is empty (with --loop).")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = deliver_batch(batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent}, failed {failed}.")
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,77 @@
+# Full-text search index for products (SQLite FTS5), kept in sync by triggers.
+
+from django.db import migrations
+
+CREATE_SQL = [
+    """
+    CREATE VIRTUAL TABLE products_product_fts USING fts5(
+        name, description, category_name,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER products_product_fts_insert AFTER INSERT ON products_product BEGIN
+        INSERT INTO products_product_fts (rowid, name, description, category_name)
+        SELECT new.id, new.name, new.description,
+               (SELECT name FROM products_category WHERE id = new.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_update
+    AFTER UPDATE OF name, description, category_id ON products_product BEGIN
+        DELETE FROM products_product_fts WHERE rowid = old.id;
+        INSERT INTO products_product_fts (rowid, name, description, category_name)
+        SELECT new.id, new.name, new.description,
+               (SELECT name FROM products_category WHERE id = new.category_id);
+    END
+    """,
+    """
+    CREATE TRIGGER products_product_fts_delete AFTER DELETE ON products_product BEGIN
+        DELETE FROM products_product_fts WHERE rowid = old.id;
+    END
+    """,
+    """
+    CREATE TRIGGER products_category_fts_update AFTER UPDATE OF name ON products_category BEGIN
+        UPDATE products_product_fts SET category_name = new.name
+        WHERE rowid IN (SELECT id FROM products_product WHERE category_id = new.id);
+    END
+    """,
+    """
+    INSERT INTO products_product_fts (rowid, name, description, category_name)
+    SELECT p.id, p.name, p.description, c.name
+    FROM products_product p JOIN products_category c ON c.id = p.category_id
+    """,
+]
+
+DROP_SQL = [
+    "DROP TRIGGER IF EXISTS products_category_fts_update",
+    "DROP TRIGGER IF EXISTS products_product_fts_delete",
+    "DROP TRIGGER IF EXISTS products_product_fts_update",
+    "DROP TRIGGER IF EXISTS products_product_fts_insert",
+    "DROP TABLE IF EXISTS products_product_fts",
+]
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in CREATE_SQL:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in DROP_SQL:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0011_product_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0016_outboundemail'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='payment_proof_sha256',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_sales_rollups(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    DailySalesRollup = apps.get_model('products', 'DailySalesRollup')
+    rows = (
+        OrderItem.objects.annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category_id', 'order__status')
+        .annotate(
+            revenue=Sum(F('quantity') * F('price')),
+            units=Sum('quantity'),
+            orders=Count('order_id', distinct=True),
+        )
+        .order_by()
+    )
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            date=row['day'],
+            category_id=row['product__category_id'],
+            status=row['order__status'],
+            revenue=row['revenue'],
+            units=row['units'],
+            order_count=row['orders'],
+        )
+        for row in rows
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0018_admin_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('status', models.CharField(max_length=20)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('units', models.IntegerField(default=0)),
+                ('order_count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sales_rollups', to='products.category')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('date', 'category', 'status'), name='unique_sales_rollup')],
+            },
+        ),
+        migrations.RunPython(backfill_sales_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_verified_purchases(apps, schema_editor):
+    OrderItem = apps.get_model('products', 'OrderItem')
+    VerifiedPurchase = apps.get_model('products', 'VerifiedPurchase')
+    pairs = (
+        OrderItem.objects.filter(order__status='Delivered')
+        .values_list('order__user_id', 'product_id')
+        .distinct()
+        .order_by()
+    )
+    VerifiedPurchase.objects.bulk_create(
+        [VerifiedPurchase(user_id=user_id, product_id=product_id) for user_id, product_id in pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0019_dailysalesrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VerifiedPurchase',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='verified_purchases', to='products.product')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='verified_purchases', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'product'), name='unique_verified_purchase')],
+            },
+        ),
+        migrations.RunPython(backfill_verified_purchases, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.6 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0022_order_history_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='paymentverification',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Verified', 'Verified'), ('Failed', 'Failed'), ('Unfulfilled', 'Unfulfilled'), ('Refunded', 'Refunded')], default='Pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.6 on 2026-10-18 10:32
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0023_payment_verification_unfulfilled'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PendingRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=255, unique=True)),
+                ('queued_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+    ]
@@ -1,14 +1,15 @@
 from django.db import models
 from django.conf import settings  # Import settings to reference the user model
-from django.utils.text import slugify
 from django.contrib.auth.models import User
 from django.utils import timezone  # Add this import
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from django.db.models import Avg
+from django.db.models import Avg, Count, Q
 from django.core.mail import send_mail
 import os
 
+from .slugs import unique_slug
+
 class Category(models.Model):
     name = models.CharField(max_length=200)
     slug = models.SlugField(max_length=250, unique=True, blank=True)
@@ -30,25 +31,86 @@ class Product(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # Denormalized review stats, kept in sync by refresh_rating_stats()
+    rating_average = models.DecimalField(max_digits=3, decimal_places=2, default=0, editable=False)
+    rating_count = models.PositiveIntegerField(default=0, editable=False, db_index=True)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        # Composite indexes for keyset pagination of the category listing
+        indexes = [
+            models.Index(fields=['category', 'price', 'id'], name='product_category_price_idx'),
+            models.Index(fields=['category', 'created_at', 'id'], name='product_category_created_idx'),
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['created_at', 'id'], name='product_created_idx'),
+        ]
+
     def save(self, *args, **kwargs):
         if not self.slug:
-            self.slug = slugify(self.name)
+            self.slug = unique_slug(Product.objects.exclude(pk=self.pk), self.name)
         super().save(*args, **kwargs)
 
     def get_average_rating(self):
-        avg_rating = self.reviews.aggregate(Avg('rating'))['rating__avg']
-        return round(avg_rating, 1) if avg_rating else 0
+        return round(self.rating_average, 1) if self.rating_count else 0
+
+    def get_rating_histogram(self):
+        """Return [(stars, count), ...] from 5 stars down to 1."""
+        return [(stars, getattr(self, f'rating_{stars}_count')) for stars in reversed(RATING_STARS)]
+
+    def refresh_rating_stats(self):
+        """Recompute the stored rating columns from this product's reviews."""
+        stats = Review.objects.filter(product_id=self.pk).aggregate(**rating_aggregates())
+        stats = normalize_rating_stats(stats)
+        Product.objects.filter(pk=self.pk).update(**stats)
+        for field, value in stats.items():
+            setattr(self, field, value)
 
     def __str__(self):
         return self.name
 
 
+RATING_STARS = range(1, 6)
+
+
+def rating_aggregates(prefix=''):
+    """Aggregate expressions for the Product rating columns.
+
+    ``prefix`` lets the same expressions run from the Product side
+    (``prefix='reviews__'``) as well as over Review rows.
+    """
+    aggregates = {
+        'rating_count': Count(f'{prefix}id'),
+        'rating_average': Avg(f'{prefix}rating'),
+    }
+    for stars in RATING_STARS:
+        aggregates[f'rating_{stars}_count'] = Count(f'{prefix}id', filter=Q(**{f'{prefix}rating': stars}))
+    return aggregates
+
+
+def normalize_rating_stats(stats):
+    stats = {field: stats[field] for field in rating_aggregates()}
+    average = stats['rating_average']
+    stats['rating_average'] = round(average, 2) if average is not None else 0
+    return stats
+
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="reviews")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
-    rating = models.PositiveSmallIntegerField()
+    rating = models.PositiveSmallIntegerField(db_index=True)
     comment = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        # Keyset pagination of a product's reviews (see products/reviews.py)
+        indexes = [
+            models.Index(fields=['product', 'created_at', 'id'], name='review_product_created_idx'),
+            models.Index(fields=['product', 'rating', 'created_at', 'id'], name='review_product_rating_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name} - {self.rating}"
@@ -63,11 +125,42 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)  # Default to 1 if no quantity is provided
 
+    class Meta:
+        constraints = [
+            # One line per product, so add-to-cart can upsert atomically
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_cart_item'),
+        ]
+
     def __str__(self):
         return f"{self.product.name} - {self.quantity} in cart"
 
 
 
+class StockHold(models.Model):
+    """Stock set aside for a user's checkout until ``expires_at``.
+
+    Holds are managed by products.inventory; expired rows are ignored by
+    every availability check and deleted by release_expired_holds.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="stock_holds")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="holds")
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_stock_hold'),
+        ]
+        indexes = [
+            models.Index(fields=['product', 'expires_at'], name='stock_hold_active_idx'),
+            models.Index(fields=['expires_at'], name='stock_hold_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for {self.user_id}"
+
+
 class Wishlist(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="wishlist")
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="wishlisted_by")
@@ -82,10 +175,20 @@ class Order(models.Model):
     phone_number = models.CharField(max_length=15)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     payment_proof = models.FileField(upload_to='products/payment', null=True, blank=True)  # Allow null for testing
-    created_at = models.DateTimeField(auto_now_add=True)
+    payment_proof_sha256 = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+    payment_method = models.CharField(
+        max_length=20,
+        choices=[
+            ('Manual', 'Manual'),
+            ('Khalti', 'Khalti'),
+        ],
+        default='Manual',
+    )
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
     status = models.CharField(
         max_length=20,
+        db_index=True,
         choices=[
             ('Pending', 'Pending'),
             ('Processing', 'Processing'),
@@ -96,6 +199,12 @@ class Order(models.Model):
         default='Pending',
     )
 
+    class Meta:
+        indexes = [
+            # Keyset pagination of a customer's order history
+            models.Index(fields=['user', 'created_at', 'id'], name='order_user_created_idx'),
+        ]
+
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
 
@@ -122,6 +231,134 @@ class OrderItem(models.Model):
         return self.quantity * self.price
 
 
+class VerifiedPurchase(models.Model):
+    """A product the user has received in a delivered order."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="verified_purchases")
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name="verified_purchases")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'product'], name='unique_verified_purchase'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} bought {self.product_id}"
+
+
+class DailySalesRollup(models.Model):
+    """Sales per day x category x order status, kept current by
+    products.rollups. ``order_count`` counts an order once in every
+    category it bought from."""
+    date = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="sales_rollups")
+    status = models.CharField(max_length=20)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    units = models.IntegerField(default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'category', 'status'], name='unique_sales_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.category_id} {self.status}"
+
+
+class PaymentVerification(models.Model):
+    """One row per Khalti payment token, so retried verifications
+    collapse into a single order."""
+    token = models.CharField(max_length=100, unique=True)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="payment_verifications")
+    amount = models.PositiveIntegerField()  # paisa
+    order = models.OneToOneField(Order, on_delete=models.SET_NULL, null=True, blank=True, related_name="payment_verification")
+    status = models.CharField(
+        max_length=20,
+        choices=[
+            ('Pending', 'Pending'),
+            ('Verified', 'Verified'),
+            ('Failed', 'Failed'),
+            # Paid, but no order could be placed: needs a refund
+            ('Unfulfilled', 'Unfulfilled'),
+            ('Refunded', 'Refunded'),
+        ],
+        default='Pending',
+    )
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Khalti {self.token} ({self.status})"
+
+
+class OutboundEmail(models.Model):
+    """A queued email. Written by products.outbox.OutboxEmailBackend and
+    delivered in batches by the run_outbox command."""
+    subject = models.CharField(max_length=998)
+    body = models.TextField(blank=True)
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    cc = models.JSONField(default=list)
+    bcc = models.JSONField(default=list)
+    reply_to = models.JSONField(default=list)
+    headers = models.JSONField(default=dict)
+    alternatives = models.JSONField(default=list)
+    attachments = models.JSONField(default=list)
+    status = models.CharField(
+        max_length=10,
+        choices=[
+            ('Pending', 'Pending'),
+            ('Sent', 'Sent'),
+            ('Dead', 'Dead'),
+        ],
+        default='Pending',
+    )
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    lease_token = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbound_email_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.status})"
+
+
+class PendingRendition(models.Model):
+    """An image whose renditions need (re)building. Queued when a product
+    or gallery image is saved and processed by build_renditions --pending."""
+    source_name = models.CharField(max_length=255, unique=True)
+    queued_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return self.source_name
+
+
+class ProductNeighbor(models.Model):
+    """Top-k co-purchase neighbours of a product, built by build_recommendations."""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbors')
+    neighbor = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='neighbor_of')
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'neighbor'], name='unique_product_neighbor'),
+        ]
+        indexes = [
+            models.Index(fields=['product', '-score'], name='product_neighbor_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.neighbor_id} ({self.score:.3f})"
+
+
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_picture = models.ImageField(upload_to='profile_pics/', default='profile_pics/default.png')
@@ -260,7 +497,7 @@ def update_order_status(request, order_id):
         order.status = new_status
         order.save()
         
-        # Send email notification
+        # Send email notification (queued in the outbox, see products/outbox.py)
         subject = f'Order #{order.id} Status Update'
         message = f'Your order status has been updated to: {new_status}'
         send_mail(
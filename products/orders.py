@@ -0,0 +1,93 @@
+# products/orders.py
+#
+# Order history for the profile pages. Orders are keyset-paginated on
+# (created_at, id) over the (user, created_at, id) index. Item counts and
+# totals are correlated subqueries, so they are only computed for the
+# rows on the page, and the page's items and products arrive in one
+# prefetch query.
+
+from django.db.models import F, IntegerField, OuterRef, Prefetch, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .models import Order, OrderItem, Review
+from .pagination import InvalidCursor, KeysetPaginator
+
+ORDERS_PER_PAGE = 10
+REVIEWS_PER_PAGE = 10
+HISTORY_ORDERING = ('-created_at', '-id')
+
+
+def _item_totals(expression, output_field=None):
+    totals = (
+        OrderItem.objects.filter(order=OuterRef('pk'))
+        .order_by()
+        .values('order')
+        .annotate(total=Sum(expression))
+        .values('total')
+    )
+    return Subquery(totals, output_field=output_field)
+
+
+def order_history_queryset(user):
+    items = (
+        OrderItem.objects.select_related('product')
+        .only('order_id', 'quantity', 'price', 'product__name', 'product__slug')
+        .annotate(line_total=F('quantity') * F('price'))
+        .order_by('id')
+    )
+    return (
+        Order.objects.filter(user=user)
+        .annotate(
+            item_count=Coalesce(_item_totals('quantity', IntegerField()), 0),
+            items_total=_item_totals(F('quantity') * F('price'), Order._meta.get_field('total_price')),
+        )
+        .prefetch_related(Prefetch('orderitem_set', queryset=items, to_attr='page_items'))
+    )
+
+
+def _page(queryset, cursor, per_page):
+    paginator = KeysetPaginator(queryset, HISTORY_ORDERING, per_page=per_page)
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        return paginator.page()
+
+
+def order_history(user, cursor=None, per_page=ORDERS_PER_PAGE):
+    """One page of ``user``'s orders, newest first.
+
+    Each order carries ``item_count``, ``items_total`` and ``page_items``
+    (its OrderItems with ``line_total`` and the product loaded).
+    """
+    return _page(order_history_queryset(user), cursor, per_page)
+
+
+def review_history(user, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """One page of the reviews ``user`` has written, newest first."""
+    reviews = Review.objects.filter(user=user).select_related('product')
+    return _page(reviews, cursor, per_page)
+
+
+def history_context(request):
+    """Template context for the order and review lists on a profile page."""
+    user = request.user
+    context = {
+        'orders': order_history(user, request.GET.get('orders_cursor')),
+        'reviews': review_history(user, request.GET.get('reviews_cursor')),
+    }
+    # Each list pages independently, keeping the other's cursor
+    for name in ('orders', 'reviews'):
+        param = f'{name}_cursor'
+        page = context[name]
+        context[f'next_{name}_url'] = _page_url(request, param, page.next_cursor) if page.has_next else None
+        context[f'first_{name}_url'] = _page_url(request, param, None) if param in request.GET else None
+    return context
+
+
+def _page_url(request, param, cursor):
+    params = request.GET.copy()
+    if cursor is None:
+        params.pop(param, None)
+    else:
+        params[param] = cursor
+    return f"?{params.urlencode()}"
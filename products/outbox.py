@@ -0,0 +1,158 @@
+# products/outbox.py
+#
+# Transactional email outbox. With EMAIL_BACKEND set to
+# OutboxEmailBackend, send_mail() and friends (including the password
+# reset views) only insert OutboundEmail rows. The run_outbox command
+# drains them in batches over a single connection to
+# OUTBOX_DELIVERY_BACKEND, retrying failures with exponential backoff and
+# marking a message Dead after OUTBOX_MAX_ATTEMPTS. Delivered messages
+# keep their envelope but not their body.
+
+import base64
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+
+def _encode_attachment(attachment):
+    filename, content, mimetype = attachment
+    if isinstance(content, bytes):
+        return [filename, base64.b64encode(content).decode(), mimetype, True]
+    return [filename, content, mimetype, False]
+
+
+def _decode_attachment(data):
+    filename, content, mimetype, is_binary = data
+    return (filename, base64.b64decode(content) if is_binary else content, mimetype)
+
+
+def to_outbound_email(message):
+    if any(not isinstance(attachment, tuple) for attachment in message.attachments):
+        raise ValueError("The outbox only supports (filename, content, mimetype) attachments.")
+    return OutboundEmail(
+        subject=message.subject,
+        body=message.body,
+        from_email=message.from_email,
+        to=list(message.to),
+        cc=list(message.cc),
+        bcc=list(message.bcc),
+        reply_to=list(message.reply_to),
+        headers=dict(message.extra_headers),
+        alternatives=[list(alternative) for alternative in getattr(message, 'alternatives', [])],
+        attachments=[_encode_attachment(tuple(a)) for a in message.attachments],
+    )
+
+
+def to_message(email, connection=None):
+    message = EmailMultiAlternatives(
+        subject=email.subject,
+        body=email.body,
+        from_email=email.from_email,
+        to=email.to,
+        cc=email.cc,
+        bcc=email.bcc,
+        reply_to=email.reply_to,
+        headers=email.headers,
+        connection=connection,
+    )
+    for content, mimetype in email.alternatives:
+        message.attach_alternative(content, mimetype)
+    for attachment in email.attachments:
+        message.attach(*_decode_attachment(attachment))
+    return message
+
+
+class OutboxEmailBackend(BaseEmailBackend):
+    """Email backend that queues messages instead of sending them."""
+
+    def send_messages(self, email_messages):
+        emails = [to_outbound_email(message) for message in email_messages if message.recipients()]
+        OutboundEmail.objects.bulk_create(emails)
+        return len(emails)
+
+
+def retry_delay(attempts):
+    base = getattr(settings, 'OUTBOX_RETRY_BACKOFF', 60)
+    return timedelta(seconds=base * 2 ** (attempts - 1))
+
+
+def claim_batch(batch_size):
+    """Lease up to ``batch_size`` due messages to this worker.
+
+    The lease moves next_attempt_at into the future, so concurrent workers
+    never pick the same rows and a crashed worker's batch is retried once
+    the lease runs out.
+    """
+    now = timezone.now()
+    due = list(
+        OutboundEmail.objects.filter(status='Pending', next_attempt_at__lte=now)
+        .order_by('next_attempt_at', 'id')
+        .values_list('id', flat=True)[:batch_size]
+    )
+    if not due:
+        return []
+    token = uuid.uuid4().hex
+    lease = timedelta(seconds=getattr(settings, 'OUTBOX_LEASE_SECONDS', 300))
+    OutboundEmail.objects.filter(
+        id__in=due, status='Pending', next_attempt_at__lte=now
+    ).update(lease_token=token, next_attempt_at=now + lease)
+    return list(OutboundEmail.objects.filter(lease_token=token).order_by('id'))
+
+
+def _record_failure(email, error, max_attempts):
+    email.last_error = repr(error)
+    if email.attempts >= max_attempts:
+        email.status = 'Dead'
+    else:
+        email.next_attempt_at = timezone.now() + retry_delay(email.attempts)
+
+
+def deliver_batch(batch_size=100):
+    """Send one batch over a single connection; returns (sent, failed)."""
+    emails = claim_batch(batch_size)
+    if not emails:
+        return 0, 0
+
+    max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+    sent = failed = 0
+    for email in emails:
+        email.attempts += 1
+        email.lease_token = ''
+    connection = get_connection(settings.OUTBOX_DELIVERY_BACKEND, fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # Mail server unreachable: the whole batch backs off together
+        for email in emails:
+            _record_failure(email, exc, max_attempts)
+        failed = len(emails)
+    else:
+        with connection:
+            for email in emails:
+                try:
+                    connection.send_messages([to_message(email, connection)])
+                except Exception as exc:
+                    failed += 1
+                    _record_failure(email, exc, max_attempts)
+                else:
+                    sent += 1
+                    email.status = 'Sent'
+                    email.sent_at = timezone.now()
+                    email.last_error = ''
+                    # Bodies can carry secrets such as password reset
+                    # links; keep only the envelope once delivered.
+                    email.body = ''
+                    email.alternatives = []
+                    email.attachments = []
+
+    OutboundEmail.objects.bulk_update(emails, [
+        'attempts', 'lease_token', 'status', 'next_attempt_at', 'sent_at', 'last_error',
+        'body', 'alternatives', 'attachments',
+    ])
+    return sent, failed
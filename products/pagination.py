@@ -0,0 +1,156 @@
+# products/pagination.py
+#
+# Keyset (cursor) pagination. Instead of OFFSET, each page continues from
+# the sort key of the last row on the previous page, so page N costs the
+# same index range scan as page 1. EstimatedCountPaginator, for admin
+# changelists, keeps OFFSET paging but avoids exact counts.
+
+import base64
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, router
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginate ``queryset`` by ``ordering`` using opaque cursors.
+
+    The ordering must end with a unique field (normally ``id``) and must
+    only use non-null model fields, e.g. ``('-created_at', '-id')``.
+    Back it with a matching composite index.
+    """
+
+    def __init__(self, queryset, ordering, per_page=24):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [
+            (name.lstrip('-'), name.startswith('-')) for name in self.ordering
+        ]
+
+    def page(self, cursor=None):
+        queryset = self.queryset.order_by(*self.ordering)
+        if cursor:
+            queryset = queryset.filter(self._after(self.decode_cursor(cursor)))
+        rows = list(queryset[:self.per_page + 1])
+        next_cursor = None
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            next_cursor = self.encode_cursor(rows[-1])
+        return KeysetPage(rows, next_cursor)
+
+    def encode_cursor(self, obj):
+        values = [_cursor_value(getattr(obj, name)) for name, _ in self.fields]
+        data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise InvalidCursor(cursor)
+            opts = self.queryset.model._meta
+            return [
+                opts.get_field(name).to_python(value)
+                for (name, _), value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError) as exc:
+            raise InvalidCursor(cursor) from exc
+
+    def _after(self, values):
+        # (a, b, c) > (x, y, z)  ==  a > x  OR  (a = x AND b > y)  OR ...
+        condition = Q()
+        for position, (name, descending) in enumerate(self.fields):
+            lookup = 'lt' if descending else 'gt'
+            clause = Q(**{f'{name}__{lookup}': values[position]})
+            for (previous, _), value in zip(self.fields[:position], values):
+                clause &= Q(**{previous: value})
+            condition |= clause
+        return condition
+
+
+def _cursor_value(value):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, which would skip
+    # rows sharing the last row's millisecond; keep the microseconds.
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return value
+
+
+class EstimatedCountPaginator(Paginator):
+    """Offset paginator that never runs an exact COUNT(*) on a big table.
+
+    Lists of up to ``count_limit`` rows are counted exactly, by counting
+    at most ``count_limit + 1`` rows, so that costs a bounded index scan.
+    Longer filtered lists stop there; pages past the limit are simply
+    not offered. Longer unfiltered lists use the database's own row
+    estimate, and a page that comes back empty because the estimate
+    overshot is treated as past the end. Meant for admin changelists
+    (see ``products.admin``).
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        capped = queryset.order_by().values('pk')[:self.count_limit + 1].count()
+        if capped <= self.count_limit or queryset.query.where:
+            return capped
+        estimate = estimated_row_count(queryset.model)
+        return max(estimate or 0, capped)
+
+    def page(self, number):
+        page = super().page(number)
+        if page.number > 1 and not page.object_list:
+            # The estimate overshot: no rows are left at this offset
+            self.count = page.start_index() - 1
+            self.__dict__.pop('num_pages', None)
+            raise EmptyPage(self.error_messages["no_results"])
+        return page
+
+
+def estimated_row_count(model):
+    """A cheap approximation of the table's row count, or None."""
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE relname = %s", [table])
+        elif connection.vendor == 'sqlite':
+            # Rowids are allocated in order, so the span between the
+            # smallest and largest is an upper bound found with two
+            # b-tree seeks; deletes in the middle make it overshoot.
+            cursor.execute(
+                f"SELECT MAX(rowid) - MIN(rowid) + 1 FROM {connection.ops.quote_name(table)}"
+            )
+        else:
+            return None
+        row = cursor.fetchone()
+    return row[0] if row and row[0] is not None and row[0] >= 0 else None
@@ -0,0 +1,185 @@
+# products/payments.py
+#
+# Khalti payment verification. The HTTP call is async. Under ASGI each
+# process shares one pooled httpx.AsyncClient, opened and closed by the
+# lifespan handler in ecommerce.asgi, so verifications reuse kept-alive
+# connections instead of paying for a new TCP+TLS handshake. Elsewhere
+# (WSGI, runserver, tests) every request runs in its own event loop,
+# which a client can't outlive, so the client is scoped to the
+# verification there. Each attempt has a strict timeout, and timeouts and
+# 5xx responses are retried a bounded number of times with exponential
+# backoff.
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import timedelta
+
+import httpx
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cart import CartService
+from .checkout import CheckoutError, EmptyCartError, OutOfStockError, place_order
+from .inventory import hold_cart
+from .models import Order, PaymentVerification
+
+logger = logging.getLogger(__name__)
+
+class KhaltiUnavailable(Exception):
+    """Khalti could not be reached or kept failing; the token may still be valid."""
+
+
+class AmountMismatchError(CheckoutError):
+    def __init__(self):
+        super().__init__("Your cart changed while the payment was being verified.")
+
+
+# (event loop, client) while the ASGI server is running
+_shared = None
+
+
+def make_client():
+    """A Khalti AsyncClient; use it as ``async with make_client() as client``."""
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(settings.KHALTI_TIMEOUT, connect=settings.KHALTI_CONNECT_TIMEOUT),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        headers={"Authorization": f"Key {settings.KHALTI_SECRET_KEY}"},
+    )
+
+
+async def open_client():
+    """Share one client between this process's verifications (lifespan startup)."""
+    global _shared
+    await close_client()
+    _shared = (asyncio.get_running_loop(), make_client())
+
+
+async def close_client():
+    """Close the shared client, if any (lifespan shutdown)."""
+    global _shared
+    shared, _shared = _shared, None
+    if shared is not None:
+        await shared[1].aclose()
+
+
+@asynccontextmanager
+async def khalti_client():
+    if _shared is not None and _shared[0] is asyncio.get_running_loop():
+        yield _shared[1]
+    else:
+        async with make_client() as client:
+            yield client
+
+
+async def verify_token(token, amount):
+    """Ask Khalti to verify ``token`` for ``amount`` paisa.
+
+    Returns True if verified and False if Khalti rejected it. Raises
+    KhaltiUnavailable once the retries are used up.
+    """
+    retries = settings.KHALTI_VERIFY_RETRIES
+    async with khalti_client() as client:
+        for attempt in range(retries + 1):
+            try:
+                response = await client.post(
+                    settings.KHALTI_VERIFY_URL, data={"token": token, "amount": amount}
+                )
+            except httpx.TransportError as exc:
+                error = exc
+            else:
+                if response.status_code < 500:
+                    return response.status_code == 200
+                error = f"HTTP {response.status_code}"
+            if attempt < retries:
+                await asyncio.sleep(settings.KHALTI_RETRY_BACKOFF * 2 ** attempt)
+    raise KhaltiUnavailable(str(error))
+
+
+def complete_order(verification, delivery_address, phone_number):
+    """Create the order for a verified payment and link it to the token.
+
+    Raises CheckoutError, leaving nothing behind, if the cart can't be
+    fulfilled or no longer costs what was paid.
+    """
+    with transaction.atomic():
+        order = place_order(Order(
+            user=verification.user,
+            delivery_address=delivery_address,
+            phone_number=phone_number,
+            payment_method='Khalti',
+            status='Processing',
+        ))
+        if order.total_price * 100 != verification.amount:
+            raise AmountMismatchError()
+        verification.order = order
+        verification.status = 'Verified'
+        verification.save(update_fields=['order', 'status', 'updated_at'])
+    return order
+
+
+def hold_cart_for_payment(user):
+    """Hold the user's whole cart before any money is taken.
+
+    Raises CheckoutError if the cart is empty or a line can't be held in
+    full. The holds outlive the Khalti call, so place_order() can't run
+    short afterwards because of other shoppers.
+    """
+    lines = list(CartService(user).items())
+    if not lines:
+        raise EmptyCartError()
+    hold_cart(user, lines)
+    for line in lines:
+        if line.available_stock < line.quantity:
+            raise OutOfStockError(line.product)
+
+
+def fail_verification(verification, error):
+    verification.status = 'Failed'
+    verification.error = error
+    verification.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def mark_unfulfilled(verification, error):
+    """Khalti took the money but no order could be placed: flag it for a refund."""
+    verification.status = 'Unfulfilled'
+    verification.error = error
+    verification.save(update_fields=['status', 'error', 'updated_at'])
+    logger.error(
+        "Khalti payment %s of %s paisa by user %s was captured but not fulfilled: %s",
+        verification.token, verification.amount, verification.user_id, error,
+    )
+
+
+def claim_timeout():
+    return timedelta(seconds=settings.KHALTI_CLAIM_TIMEOUT)
+
+
+def claim_expired(verification):
+    """True for a Pending claim whose request died before finishing."""
+    return (
+        verification.status == 'Pending'
+        and verification.updated_at < timezone.now() - claim_timeout()
+    )
+
+
+def claim_token(token, user, amount):
+    """Record ``token`` once; returns (verification, claimed).
+
+    ``claimed`` is True if this request should verify the token: it is
+    new, or the user's earlier claim expired (see claim_expired()).
+    """
+    verification, created = PaymentVerification.objects.get_or_create(
+        token=token, defaults={'user': user, 'amount': amount}
+    )
+    if created:
+        return verification, True
+    now = timezone.now()
+    # Conditional UPDATE, so only one retry can take an expired claim over
+    taken = PaymentVerification.objects.filter(
+        pk=verification.pk, user=user, status='Pending', updated_at__lt=now - claim_timeout(),
+    ).update(amount=amount, updated_at=now)
+    if taken:
+        verification.refresh_from_db()
+    return verification, bool(taken)
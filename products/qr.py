@@ -0,0 +1,66 @@
+# products/qr.py
+#
+# Payment QR codes for orders. The PNG for a payload is rendered once,
+# written to default storage under a content-addressed name
+# (qr_codes/<sha256>.png) and kept in an in-process LRU, so repeat views
+# of the same order neither re-render nor touch the disk. Its URL carries
+# the same digest, so a changed total is a new URL and browsers may cache
+# each one forever.
+
+import hashlib
+import io
+import json
+from functools import lru_cache
+
+import qrcode
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.urls import reverse
+
+QR_ROOT = 'qr_codes'
+QR_CACHE_SIZE = 256
+
+
+def payment_payload(order):
+    """The text encoded in an order's payment QR."""
+    return json.dumps({
+        'merchant': settings.PAYMENT_QR_MERCHANT,
+        'order': order.id,
+        'amount': str(order.total_price),
+    }, sort_keys=True, separators=(',', ':'))
+
+
+def payload_digest(payload):
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def payment_qr_url(order):
+    digest = payload_digest(payment_payload(order))
+    return reverse('order_payment_qr', args=[order.id, digest])
+
+
+def qr_name(payload):
+    return f'{QR_ROOT}/{payload_digest(payload)}.png'
+
+
+def render_qr(payload):
+    image = qrcode.make(payload, box_size=8, border=2)
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@lru_cache(maxsize=QR_CACHE_SIZE)
+def qr_png(payload):
+    """PNG bytes for ``payload``, from memory, disk or a fresh render."""
+    name = qr_name(payload)
+    if default_storage.exists(name):
+        with default_storage.open(name, 'rb') as stored:
+            return stored.read()
+    png = render_qr(payload)
+    saved = default_storage.save(name, ContentFile(png))
+    if saved != name:
+        # Another process wrote the same content first
+        default_storage.delete(saved)
+    return png
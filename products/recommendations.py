@@ -0,0 +1,99 @@
+# products/recommendations.py
+#
+# Item-to-item recommendations from co-purchases. The similarity matrix is
+# built offline (``manage.py build_recommendations``) and stored as top-k
+# neighbours per product in ProductNeighbor; serving a user is then one
+# indexed lookup over the neighbours of what they already bought.
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import OrderItem, Product, ProductNeighbor
+
+
+def purchased_product_ids(user):
+    return (
+        OrderItem.objects
+        .filter(order__user=user)
+        .exclude(order__status='Cancelled')
+        .values('product_id')
+    )
+
+
+def recommend_for_user(user, limit=4):
+    """Products most similar to the user's purchases, excluding those purchases."""
+    purchased = purchased_product_ids(user)
+    return list(
+        Product.objects
+        .filter(neighbor_of__product__in=purchased)
+        .exclude(id__in=purchased)
+        .annotate(recommendation_score=Sum('neighbor_of__score'))
+        .order_by('-recommendation_score', 'id')[:limit]
+    )
+
+
+def build_neighbors(top_k=20):
+    """Compute cosine co-purchase similarity and return ProductNeighbor rows.
+
+    Each (user, product) pair counts once however often it was bought, so
+    the score reflects how many customers bought both products.
+    """
+    import numpy as np
+    from scipy import sparse
+
+    pairs = (
+        OrderItem.objects
+        .exclude(order__status='Cancelled')
+        .values_list('order__user_id', 'product_id')
+        .distinct()
+    )
+    user_index = {}
+    product_ids = []
+    product_index = {}
+    rows, cols = [], []
+    for user_id, product_id in pairs.iterator(chunk_size=5000):
+        rows.append(user_index.setdefault(user_id, len(user_index)))
+        if product_id not in product_index:
+            product_index[product_id] = len(product_ids)
+            product_ids.append(product_id)
+        cols.append(product_index[product_id])
+
+    if not rows:
+        return []
+
+    purchases = sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(user_index), len(product_ids)),
+    )
+    # Product x product co-purchase counts; the diagonal holds buyers per product
+    co_counts = (purchases.T @ purchases).tocsr()
+    buyers = co_counts.diagonal()
+    co_counts.setdiag(0)
+    co_counts.eliminate_zeros()
+
+    inverse_norm = sparse.diags(1.0 / np.sqrt(buyers))
+    similarity = (inverse_norm @ co_counts @ inverse_norm).tocsr()
+
+    neighbors = []
+    for row in range(similarity.shape[0]):
+        start, end = similarity.indptr[row], similarity.indptr[row + 1]
+        if start == end:
+            continue
+        scores = similarity.data[start:end]
+        columns = similarity.indices[start:end]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            scores, columns = scores[best], columns[best]
+        for column, score in zip(columns, scores):
+            neighbors.append(ProductNeighbor(
+                product_id=product_ids[row],
+                neighbor_id=product_ids[column],
+                score=float(score),
+            ))
+    return neighbors
+
+
+@transaction.atomic
+def store_neighbors(neighbors, batch_size=1000):
+    ProductNeighbor.objects.all().delete()
+    ProductNeighbor.objects.bulk_create(neighbors, batch_size=batch_size)
@@ -0,0 +1,196 @@
+# products/renditions.py
+#
+# Resized copies of uploaded images. Every source image gets one file per
+# (size, format) under a deterministic path:
+#
+#   products/images/phone.jpg -> renditions/products/images/phone/card.webp
+#
+# so templates can build URLs without a database lookup (see the
+# responsive_image tag in templatetags/product_images.py). A manifest.json
+# written after the renditions records the source's SHA-256, the size spec
+# and the width each size actually came out at (images are never upscaled
+# and keep their aspect ratio), so the build_renditions command can skip
+# images whose renditions are already current and srcsets can give true
+# ``w`` descriptors. Saving a product or gallery image only queues a
+# PendingRendition once the transaction commits; build_renditions
+# --pending builds the queue, so no request waits on Pillow and
+# templates show the original until the renditions exist.
+
+import hashlib
+import io
+import json
+import posixpath
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .models import PendingRendition
+
+RENDITION_ROOT = 'renditions'
+
+# name -> (max width, max height); images are scaled to fit, never cropped
+# or upscaled
+RENDITION_SIZES = {
+    'thumb': (150, 150),
+    'card': (400, 400),
+    'detail': (900, 900),
+}
+
+# format -> (file extension, Pillow save options)
+RENDITION_FORMATS = {
+    'webp': ('webp', {'format': 'WEBP', 'quality': 80, 'method': 4}),
+    'jpeg': ('jpg', {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+# Seconds rendition_widths() trusts a cached answer. A "not built yet"
+# answer expires quickly so new renditions show up soon after a build.
+EXISTS_CACHE_TIMEOUT = 24 * 60 * 60
+MISSING_CACHE_TIMEOUT = 60
+
+
+def rendition_dir(source_name):
+    base, _ = posixpath.splitext(source_name)
+    return f'{RENDITION_ROOT}/{base}'
+
+
+def rendition_name(source_name, size, image_format):
+    extension = RENDITION_FORMATS[image_format][0]
+    return f'{rendition_dir(source_name)}/{size}.{extension}'
+
+
+def manifest_name(source_name):
+    return f'{rendition_dir(source_name)}/manifest.json'
+
+
+def spec_fingerprint():
+    """Changes whenever the sizes or encoder settings change."""
+    spec = json.dumps([RENDITION_SIZES, RENDITION_FORMATS], sort_keys=True)
+    return hashlib.sha256(spec.encode()).hexdigest()[:16]
+
+
+def _widths_key(source_name):
+    return 'renditions:' + hashlib.sha256(source_name.encode()).hexdigest()
+
+
+def read_manifest(source_name, storage=default_storage):
+    try:
+        with storage.open(manifest_name(source_name), 'rb') as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return None
+
+
+def _measure(source_name, storage):
+    # Manifests written before widths were recorded
+    widths = {}
+    for size in RENDITION_SIZES:
+        with storage.open(rendition_name(source_name, size, 'jpeg'), 'rb') as rendition:
+            widths[size] = Image.open(rendition).width
+    return widths
+
+
+def rendition_widths(source_name, storage=default_storage):
+    """{size: pixel width} once a complete set of renditions exists, else None.
+
+    Cached per source.
+    """
+    key = _widths_key(source_name)
+    widths = cache.get(key)
+    if widths is None:
+        # The manifest is written last, so it marks a complete set
+        manifest = read_manifest(source_name, storage)
+        if manifest is None:
+            widths = False
+        else:
+            widths = manifest.get('widths') or _measure(source_name, storage)
+        cache.set(key, widths, EXISTS_CACHE_TIMEOUT if widths else MISSING_CACHE_TIMEOUT)
+    return widths or None
+
+
+def queue_renditions(source_name):
+    """Queue ``source_name`` for build_renditions --pending."""
+    PendingRendition.objects.bulk_create(
+        [PendingRendition(source_name=source_name, queued_at=timezone.now())],
+        update_conflicts=True, unique_fields=['source_name'], update_fields=['queued_at'],
+    )
+
+
+def _replace(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, ContentFile(content))
+
+
+def _encode(image, image_format):
+    options = RENDITION_FORMATS[image_format][1]
+    if options['format'] == 'JPEG' and image.mode == 'RGBA':
+        # JPEG has no alpha channel: flatten onto white
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    image.save(buffer, **options)
+    return buffer.getvalue()
+
+
+def generate_renditions(source_name, storage=default_storage, source_bytes=None):
+    """Write every size and format for ``source_name`` plus its manifest.
+
+    Returns the names written.
+    """
+    if source_bytes is None:
+        with storage.open(source_name, 'rb') as source:
+            source_bytes = source.read()
+    original = ImageOps.exif_transpose(Image.open(io.BytesIO(source_bytes)))
+    original.load()
+    if original.mode not in ('RGB', 'RGBA'):
+        has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+        original = original.convert('RGBA' if has_alpha else 'RGB')
+
+    written, widths = [], {}
+    for size, box in RENDITION_SIZES.items():
+        resized = original.copy()
+        resized.thumbnail(box, Image.LANCZOS)
+        widths[size] = resized.width
+        for image_format in RENDITION_FORMATS:
+            name = rendition_name(source_name, size, image_format)
+            _replace(storage, name, _encode(resized, image_format))
+            written.append(name)
+
+    manifest = {
+        'source_sha256': hashlib.sha256(source_bytes).hexdigest(),
+        'spec': spec_fingerprint(),
+        'widths': widths,
+    }
+    _replace(storage, manifest_name(source_name), json.dumps(manifest).encode())
+    cache.set(_widths_key(source_name), widths, EXISTS_CACHE_TIMEOUT)
+    return written
+
+
+def refresh_renditions(source_name, force=False, storage=default_storage, only_missing=False):
+    """Regenerate renditions unless the manifest shows they are current.
+
+    With ``only_missing``, any image that has a manifest is skipped
+    without reading its source. Returns ``(status, bytes_read)`` where
+    status is 'generated', 'skipped' or 'missing'. Used by the backfill
+    worker processes.
+    """
+    if only_missing and not force and storage.exists(manifest_name(source_name)):
+        return 'skipped', 0
+    try:
+        with storage.open(source_name, 'rb') as source:
+            source_bytes = source.read()
+    except FileNotFoundError:
+        return 'missing', 0
+    manifest = read_manifest(source_name, storage) or {}
+    current = (manifest.get('source_sha256'), manifest.get('spec')) == (
+        hashlib.sha256(source_bytes).hexdigest(), spec_fingerprint(),
+    )
+    if current and not force:
+        return 'skipped', len(source_bytes)
+    generate_renditions(source_name, storage, source_bytes=source_bytes)
+    return 'generated', len(source_bytes)
+
@@ -0,0 +1,74 @@
+# products/reviews.py
+#
+# Review helpers. Review eligibility and the "Verified buyer" badge read
+# the VerifiedPurchase table, one row per (user, product) the user has
+# received, which is filled when an order is marked Delivered. Review
+# lists are keyset-paginated per product; the star histogram comes from
+# the rating columns stored on Product, refreshed on every review write.
+
+from django.db.models import Exists, OuterRef
+
+from .models import OrderItem, VerifiedPurchase
+from .pagination import InvalidCursor, KeysetPaginator
+
+REVIEWS_PER_PAGE = 10
+
+# Each ordering is backed by a (product, ...) index on Review
+REVIEW_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'highest': ('-rating', '-created_at', '-id'),
+    'lowest': ('rating', '-created_at', '-id'),
+}
+
+
+def record_verified_purchases(order):
+    """Mark every product in a delivered ``order`` as bought by its user."""
+    product_ids = set(OrderItem.objects.filter(order_id=order.pk).values_list('product_id', flat=True))
+    VerifiedPurchase.objects.bulk_create(
+        [VerifiedPurchase(user_id=order.user_id, product_id=product_id) for product_id in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def backfill_verified_purchases(batch_size=1000):
+    """Create VerifiedPurchase rows for all delivered orders; returns pairs seen."""
+    pairs = (
+        OrderItem.objects.filter(order__status='Delivered')
+        .values_list('order__user_id', 'product_id')
+        .distinct()
+        .order_by()
+    )
+    batch = []
+    seen = 0
+    for user_id, product_id in pairs.iterator(chunk_size=batch_size):
+        batch.append(VerifiedPurchase(user_id=user_id, product_id=product_id))
+        if len(batch) >= batch_size:
+            VerifiedPurchase.objects.bulk_create(batch, ignore_conflicts=True)
+            seen += len(batch)
+            batch = []
+    VerifiedPurchase.objects.bulk_create(batch, ignore_conflicts=True)
+    return seen + len(batch)
+
+
+def has_verified_purchase(user, product):
+    return VerifiedPurchase.objects.filter(user=user, product=product).exists()
+
+
+def with_verified_badge(reviews):
+    """Annotate ``verified_buyer`` on each review, in the same query."""
+    return reviews.annotate(verified_buyer=Exists(
+        VerifiedPurchase.objects.filter(user=OuterRef('user'), product=OuterRef('product'))
+    ))
+
+
+def review_page(product, sort='newest', cursor=None):
+    """One page of ``product``'s reviews; a bad cursor restarts at page one."""
+    paginator = KeysetPaginator(
+        with_verified_badge(product.reviews.select_related('user')),
+        REVIEW_SORTS.get(sort, REVIEW_SORTS['newest']),
+        per_page=REVIEWS_PER_PAGE,
+    )
+    try:
+        return paginator.page(cursor)
+    except InvalidCursor:
+        return paginator.page()
@@ -0,0 +1,162 @@
+# products/rollups.py
+#
+# Daily sales rollups. Each order contributes, per category it bought
+# from, its revenue, units and a count of one to the row for (local order
+# date, category, status). Checkout adds the contribution, a status
+# change moves it between status rows and deleting the order takes it
+# away (see products/signals.py). Saving or deleting an OrderItem outside
+# checkout, e.g. for an order built in a shell, recomputes that order's
+# date. Bulk .update() calls bypass the signals; rebuild_rollups()
+# recomputes any date range from the orders.
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import DailySalesRollup, OrderItem
+
+
+def sales_date(order):
+    return timezone.localdate(order.created_at)
+
+
+def contributions_from_lines(lines):
+    """{category_id: (revenue, units)} for checkout cart lines."""
+    totals = defaultdict(lambda: [Decimal(0), 0])
+    for line in lines:
+        total = totals[line.product.category_id]
+        total[0] += line.product.price * line.quantity
+        total[1] += line.quantity
+    return {category_id: tuple(total) for category_id, total in totals.items()}
+
+
+def order_contributions(order):
+    """{category_id: (revenue, units)} from the order's stored items."""
+    rows = (
+        OrderItem.objects.filter(order_id=order.pk)
+        .values('product__category_id')
+        .annotate(revenue=Sum(F('quantity') * F('price')), units=Sum('quantity'))
+        .order_by()
+    )
+    return {row['product__category_id']: (row['revenue'], row['units']) for row in rows}
+
+
+def apply_contributions(date, status, contributions, sign=1):
+    for category_id, (revenue, units) in contributions.items():
+        _increment(
+            dict(date=date, category_id=category_id, status=status),
+            revenue=sign * revenue, units=sign * units, order_count=sign,
+        )
+    if sign < 0:
+        DailySalesRollup.objects.filter(date=date, status=status, order_count__lte=0).delete()
+
+
+def _increment(key, **deltas):
+    changes = {field: F(field) + delta for field, delta in deltas.items()}
+    if DailySalesRollup.objects.filter(**key).update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            DailySalesRollup.objects.create(**key, **deltas)
+    except IntegrityError:
+        # Created concurrently since our UPDATE; add to that row instead
+        DailySalesRollup.objects.filter(**key).update(**changes)
+
+
+def record_order(order, lines):
+    """Add a just-placed order. Called inside the checkout transaction."""
+    apply_contributions(sales_date(order), order.status, contributions_from_lines(lines))
+
+
+def refresh_order_date(order):
+    """Recompute the rollups for ``order``'s date from its stored items.
+
+    For items saved or deleted outside checkout, which bulk-creates its
+    own; whole-day rows keep each order counted once per category.
+    """
+    day = sales_date(order)
+    rebuild_rollups(day, day)
+
+
+def move_order(order, old_status):
+    contributions = order_contributions(order)
+    date = sales_date(order)
+    with transaction.atomic():
+        apply_contributions(date, old_status, contributions, sign=-1)
+        apply_contributions(date, order.status, contributions)
+
+
+def remove_order(order):
+    apply_contributions(sales_date(order), order.status, order_contributions(order), sign=-1)
+
+
+def day_bounds(since, until):
+    """Aware datetimes covering local dates ``since`` to ``until`` inclusive."""
+    start = timezone.make_aware(datetime.datetime.combine(since, datetime.time.min))
+    end = timezone.make_aware(datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time.min))
+    return start, end
+
+
+@transaction.atomic
+def rebuild_rollups(since, until):
+    """Recompute the rollup rows for local dates ``since``..``until``."""
+    start, end = day_bounds(since, until)
+    rows = (
+        OrderItem.objects.filter(order__created_at__gte=start, order__created_at__lt=end)
+        .annotate(day=TruncDate('order__created_at'))
+        .values('day', 'product__category_id', 'order__status')
+        .annotate(
+            revenue=Sum(F('quantity') * F('price')),
+            units=Sum('quantity'),
+            orders=Count('order_id', distinct=True),
+        )
+        .order_by()
+    )
+    DailySalesRollup.objects.filter(date__gte=since, date__lte=until).delete()
+    rollups = DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(
+            date=row['day'],
+            category_id=row['product__category_id'],
+            status=row['order__status'],
+            revenue=row['revenue'],
+            units=row['units'],
+            order_count=row['orders'],
+        )
+        for row in rows
+    ], batch_size=1000)
+    return len(rollups)
+
+
+def sales_dashboard(rollups, months=12):
+    """Month-over-month and breakdown figures from rollup rows only."""
+    first_month = timezone.localdate().replace(day=1)
+    for _ in range(months - 1):
+        first_month = (first_month - datetime.timedelta(days=1)).replace(day=1)
+    totals = dict(revenue=Sum('revenue'), units=Sum('units'), orders=Sum('order_count'))
+
+    monthly = list(
+        rollups.filter(date__gte=first_month)
+        .annotate(month=TruncMonth('date'))
+        .values('month')
+        .annotate(**totals)
+        .order_by('month')
+    )
+    peak = max((row['revenue'] for row in monthly), default=0) or 1
+    previous = None
+    for row in monthly:
+        row['percent'] = round(100 * row['revenue'] / peak)
+        row['change'] = (
+            round(100 * (row['revenue'] - previous) / previous, 1) if previous else None
+        )
+        previous = row['revenue']
+
+    return {
+        'monthly_sales': monthly,
+        'category_sales': rollups.values('category__name').annotate(**totals).order_by('-revenue'),
+        'status_sales': rollups.values('status').annotate(**totals).order_by('-revenue'),
+    }
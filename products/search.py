@@ -0,0 +1,71 @@
+# products/search.py
+#
+# Storefront product search. On SQLite this queries the FTS5 table
+# ``products_product_fts`` (created in migration 0012 and kept in sync by
+# triggers, so bulk_create and queryset.update() are covered too) and ranks
+# matches with BM25. Other databases fall back to a name lookup.
+
+import re
+
+from django.db import connection
+
+from .models import Product
+
+FTS_TABLE = 'products_product_fts'
+
+# bm25() column weights: name, description, category_name
+BM25_WEIGHTS = (10.0, 1.0, 4.0)
+
+MAX_QUERY_TERMS = 8
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query: every term must match, as a prefix.
+
+    Terms are quoted so FTS5 operators typed by users are treated as text.
+    """
+    terms = re.findall(r'\w+', text.lower())[:MAX_QUERY_TERMS]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_product_ids(text, limit=50):
+    """Return ids of matching products, best match first."""
+    match = build_match_query(text)
+    if not match:
+        return []
+    if connection.vendor != 'sqlite':
+        return list(
+            Product.objects.filter(name__icontains=text.strip())
+            .order_by('-rating_count', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s "
+            f"ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s",
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def search_products(text, limit=50):
+    ids = search_product_ids(text, limit=limit)
+    products = Product.objects.in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
+
+
+def rebuild_search_index():
+    """Repopulate the FTS table from scratch and merge its b-trees."""
+    if connection.vendor != 'sqlite':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE} (rowid, name, description, category_name) "
+            "SELECT p.id, p.name, p.description, c.name "
+            "FROM products_product p JOIN products_category c ON c.id = p.category_id"
+        )
+        indexed = cursor.rowcount
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+    return indexed
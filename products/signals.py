@@ -0,0 +1,84 @@
+# products/signals.py
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_catalog_version
+from .models import Category, Order, OrderItem, Product, ProductImage, Review
+from .renditions import queue_renditions
+from .reviews import record_verified_purchases
+from .rollups import move_order, refresh_order_date, remove_order
+
+
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def refresh_product_rating(sender, instance, **kwargs):
+    # Only the pk is needed; during a cascading product delete the
+    # UPDATE simply matches no rows.
+    Product(pk=instance.product_id).refresh_rating_stats()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_catalog_cache(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_init, sender=Product)
+@receiver(post_init, sender=ProductImage)
+def remember_image(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred image isn't fetched for every row
+    image = instance.__dict__.get('image')
+    instance._saved_image = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def queue_image_renditions(sender, instance, **kwargs):
+    # Only queue the name once it is committed; the build_renditions
+    # --pending worker does the Pillow work outside the request
+    if 'image' not in instance.__dict__:
+        return  # deferred, so unchanged
+    name = instance.image.name
+    if not name or name == instance._saved_image:
+        return
+    instance._saved_image = name
+    transaction.on_commit(lambda: queue_renditions(name))
+
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    # Read from __dict__ so a deferred status isn't fetched for every row
+    instance._saved_status = instance.__dict__.get('status')
+
+
+@receiver(post_save, sender=Order)
+def order_status_changed(sender, instance, created, **kwargs):
+    # A new order has no items yet: place_order() adds it once they
+    # exist, and otherwise saving each item recounts its date (see below)
+    old_status = instance._saved_status
+    instance._saved_status = instance.status
+    if created or old_status is None or old_status == instance.status:
+        return
+    move_order(instance, old_status)
+    if instance.status == 'Delivered':
+        record_verified_purchases(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def remove_order_rollups(sender, instance, **kwargs):
+    remove_order(instance)
+
+
+@receiver(post_save, sender=OrderItem)
+@receiver(post_delete, sender=OrderItem)
+def refresh_item_rollups(sender, instance, origin=None, **kwargs):
+    # Deleting the order already took it out in remove_order_rollups
+    if isinstance(origin, Order) or getattr(origin, 'model', None) is Order:
+        return
+    refresh_order_date(instance.order)
@@ -0,0 +1,42 @@
+# products/slugs.py
+#
+# Unique slug allocation. Duplicate names get -2, -3, ... suffixes; the
+# allocator remembers the last suffix per base so a bulk import of many
+# same-named rows doesn't rescan from -2 every time.
+
+from django.utils.text import slugify
+
+# Room left for a "-<n>" suffix within the field's max_length
+SUFFIX_ROOM = 8
+
+
+def slug_base(text, max_length):
+    return slugify(text)[:max_length - SUFFIX_ROOM].strip('-') or 'item'
+
+
+class SlugAllocator:
+    def __init__(self, taken=(), max_length=250):
+        self.taken = set(taken)
+        self.max_length = max_length
+        self.next_suffix = {}
+
+    def reserve(self, slug):
+        self.taken.add(slug)
+
+    def allocate(self, text):
+        base = slug_base(text, self.max_length)
+        slug = base
+        suffix = self.next_suffix.get(base, 2)
+        while slug in self.taken:
+            slug = f'{base}-{suffix}'
+            suffix += 1
+        self.next_suffix[base] = suffix
+        self.taken.add(slug)
+        return slug
+
+
+def unique_slug(queryset, text, max_length=250):
+    """A slug for ``text`` not used by any row of ``queryset``."""
+    base = slug_base(text, max_length)
+    taken = queryset.filter(slug__startswith=base).values_list('slug', flat=True)
+    return SlugAllocator(taken, max_length).allocate(text)
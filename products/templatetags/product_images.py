@@ -0,0 +1,51 @@
+# products/templatetags/product_images.py
+
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from products.renditions import rendition_name, rendition_widths
+
+register = template.Library()
+
+DEFAULT_SIZES = {
+    'thumb': '150px',
+    'card': '(max-width: 576px) 100vw, 400px',
+    'detail': '(max-width: 768px) 100vw, 900px',
+}
+
+
+def _srcset(field_file, widths, image_format):
+    # Small sources come out the same width at several sizes; list each width once
+    storage = field_file.storage
+    candidates = {}
+    for size, width in widths.items():
+        candidates.setdefault(width, rendition_name(field_file.name, size, image_format))
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in candidates.items())
+
+
+@register.simple_tag
+def responsive_image(field_file, size='card', alt='', sizes=None, **attrs):
+    """Render ``<picture>`` with WebP and JPEG srcsets for an image field.
+
+    Falls back to a plain ``<img>`` of the original until its renditions
+    have been generated. Extra keyword arguments become ``<img>``
+    attributes, e.g. ``class="card-img-top"``.
+    """
+    if not field_file:
+        return ''
+    attrs.setdefault('loading', 'lazy')
+    extra = format_html_join('', ' {}="{}"', attrs.items())
+    widths = rendition_widths(field_file.name, field_file.storage)
+    if widths is None:
+        return format_html('<img src="{}" alt="{}"{}>', field_file.url, alt, extra)
+
+    sizes = sizes or DEFAULT_SIZES[size]
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}"{}>'
+        '</picture>',
+        _srcset(field_file, widths, 'webp'), sizes,
+        field_file.storage.url(rendition_name(field_file.name, size, 'jpeg')),
+        _srcset(field_file, widths, 'jpeg'), sizes, alt, extra,
+    )
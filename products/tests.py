@@ -1,3 +1,1787 @@
-from django.test import TestCase
+import asyncio
+import base64
+import csv
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from contextlib import closing, contextmanager
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.paginator import EmptyPage
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from PIL import Image
+
+from ecommerce.asgi import application
+from ecommerce.instrumentation import QueryInstrumentationMiddleware, fingerprint
+from ecommerce.routers import PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter, primary_reads
+from ecommerce.testing import QueryBudgetMixin
+
+from . import payments
+from .cache import CATALOG_VERSION_KEY, bump_catalog_version, cached, get_catalog_version
+from .cart import CartService
+from .catalog_import import CatalogImporter
+from .checkout import EmptyCartError, OutOfStockError, place_order
+from .facets import build_facets, catalog_facets
+from .inventory import hold_cart, with_available_stock
+from .models import (
+    CartItem, Category, DailySalesRollup, Order, OrderItem, OutboundEmail, PaymentVerification,
+    PendingRendition, Product, ProductImage, ProductNeighbor, Review, StockHold, VerifiedPurchase,
+)
+from .outbox import deliver_batch
+from .orders import order_history
+from .pagination import EstimatedCountPaginator, InvalidCursor, KeysetPaginator
+from .qr import payload_digest, payment_payload, payment_qr_url, qr_png
+from .recommendations import build_neighbors, recommend_for_user, store_neighbors
+from .renditions import generate_renditions, manifest_name, rendition_name, rendition_widths
+from .reviews import backfill_verified_purchases
+from .rollups import rebuild_rollups
+from .search import FTS_TABLE, build_match_query, search_product_ids
+
+
+def make_product(stock=10, price='100.00', name='Phone'):
+    category, _ = Category.objects.get_or_create(name='Phones', slug='phones')
+    return Product.objects.create(
+        category=category, name=name, description='', price=price, stock=stock,
+    )
+
+
+def new_order(user):
+    return Order(user=user, delivery_address='Pokhara', phone_number='9800000000')
+
+
+class RatingStatsTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        self.users = [User.objects.create_user(f'reviewer{index}') for index in range(3)]
+
+    def review(self, user, rating):
+        return Review.objects.create(product=self.product, user=user, rating=rating)
+
+    def test_review_signals_keep_columns_current(self):
+        self.review(self.users[0], 5)
+        low = self.review(self.users[1], 2)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.rating_average), (2, Decimal('3.50')))
+        self.assertEqual(self.product.get_rating_histogram(), [(5, 1), (4, 0), (3, 0), (2, 1), (1, 0)])
+
+        low.rating = 4
+        low.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_average, self.product.rating_2_count), (Decimal('4.50'), 0))
+
+        low.delete()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.rating_count, self.product.get_average_rating()), (1, Decimal('5.0')))
+
+    def test_rebuild_ratings(self):
+        for user, rating in zip(self.users, (1, 3, 5)):
+            self.review(user, rating)
+        unreviewed = make_product(name='Case')
+        # Drift left behind by bulk updates that skip the signals
+        Product.objects.update(rating_count=9, rating_average=1, rating_5_count=9)
+
+        call_command('rebuild_ratings', batch_size=1, stdout=io.StringIO())
+
+        self.product.refresh_from_db()
+        unreviewed.refresh_from_db()
+        self.assertEqual(
+            (self.product.rating_count, self.product.rating_average, self.product.rating_5_count),
+            (3, Decimal('3.00'), 1),
+        )
+        self.assertEqual((unreviewed.rating_count, unreviewed.rating_average, unreviewed.rating_5_count), (0, 0, 0))
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_until_catalog_changes(self):
+        builds = []
+
+        def build():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual((cached('section', build), cached('section', build)), (1, 1))
+        version = get_catalog_version()
+        make_product()
+        self.assertGreater(get_catalog_version(), version)
+        self.assertEqual(cached('section', build), 2)
+
+    def test_version_survives_eviction(self):
+        version = get_catalog_version()
+        cache.delete(CATALOG_VERSION_KEY)
+        # Restarts from the clock, never below the version it replaces
+        self.assertGreaterEqual(bump_catalog_version(), version)
+
+    def test_version_is_shared_between_processes(self):
+        version = get_catalog_version()
+        # Another worker process handles a catalog change
+        subprocess.run(
+            [sys.executable, '-c', 'import django; django.setup(); '
+             'from products.cache import bump_catalog_version; bump_catalog_version()'],
+            env={**os.environ, 'DJANGO_SETTINGS_MODULE': 'ecommerce.settings',
+                 'CACHE_DIR': str(settings.CACHES['default']['LOCATION'])},
+            cwd=settings.BASE_DIR, check=True,
+        )
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_warm_homepage_skips_catalog_queries(self):
+        make_product(name='Old phone')
+        self.client.get(reverse('homepage'))
+        with self.assertNumQueries(0):
+            self.client.get(reverse('homepage'))
+
+        make_product(name='New phone')
+        response = self.client.get(reverse('homepage'))
+        self.assertContains(response, 'New phone')
+
+
+def buy(user, *products, status='Delivered'):
+    order = Order.objects.create(
+        user=user, delivery_address='Pokhara', phone_number='9800000000', total_price=0, status=status,
+    )
+    for product in products:
+        OrderItem.objects.create(order=order, product=product, quantity=1, price=product.price)
+    return order
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.phone, self.case, self.charger, self.cable = (
+            make_product(name=name) for name in ('Phone', 'Case', 'Charger', 'Cable')
+        )
+        self.users = [User.objects.create_user(f'buyer{index}') for index in range(4)]
+
+    def test_neighbours_score_co_purchases(self):
+        buy(self.users[0], self.phone, self.case)
+        buy(self.users[1], self.phone, self.case)
+        buy(self.users[2], self.phone, self.charger)
+        # Cancelled orders are not evidence of anything
+        buy(self.users[3], self.phone, self.cable, status='Cancelled')
+
+        call_command('build_recommendations', stdout=io.StringIO())
+
+        scores = {
+            (row.product_id, row.neighbor_id): row.score
+            for row in ProductNeighbor.objects.all()
+        }
+        self.assertNotIn((self.phone.id, self.cable.id), scores)
+        # 2 of 3 phone buyers bought a case: 2 / sqrt(3 * 2)
+        self.assertAlmostEqual(scores[self.phone.id, self.case.id], 2 / 6 ** 0.5, places=5)
+        self.assertGreater(scores[self.phone.id, self.case.id], scores[self.phone.id, self.charger.id])
+
+    def test_recommend_for_user_excludes_purchases(self):
+        buy(self.users[0], self.phone, self.case)
+        buy(self.users[1], self.phone, self.case)
+        buy(self.users[2], self.phone, self.charger)
+        store_neighbors(build_neighbors())
+
+        newcomer = self.users[3]
+        buy(newcomer, self.phone)
+        self.assertEqual(recommend_for_user(newcomer), [self.case, self.charger])
+
+        buy(newcomer, self.case)
+        self.assertEqual(recommend_for_user(newcomer), [self.charger])
+
+    def test_homepage_shows_recommendations(self):
+        buy(self.users[0], self.phone, self.case)
+        store_neighbors(build_neighbors())
+        newcomer = self.users[1]
+        buy(newcomer, self.phone)
+        self.client.force_login(newcomer)
+
+        response = self.client.get(reverse('homepage'))
+
+        self.assertEqual(list(response.context['recommended_products']), [self.case])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.products = [make_product(name=f'Phone {index}', price=f'{100 + index % 3}.00') for index in range(7)]
+
+    def walk(self, paginator):
+        seen, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            seen.extend(product.id for product in page)
+            if not page.has_next:
+                return seen
+            cursor = page.next_cursor
+
+    def test_pages_cover_every_row_once(self):
+        for ordering in (('-created_at', '-id'), ('price', 'id'), ('-price', '-id')):
+            paginator = KeysetPaginator(Product.objects.all(), ordering, per_page=3)
+            self.assertEqual(
+                self.walk(paginator),
+                list(Product.objects.order_by(*ordering).values_list('id', flat=True)),
+                ordering,
+            )
+
+    def test_rows_sharing_a_millisecond(self):
+        # Bulk imports write many rows per millisecond
+        base = timezone.now().replace(microsecond=500000)
+        for offset, product in enumerate(self.products):
+            Product.objects.filter(pk=product.pk).update(created_at=base + timedelta(microseconds=offset * 100))
+
+        paginator = KeysetPaginator(Product.objects.all(), ('-created_at', '-id'), per_page=2)
+
+        self.assertEqual(self.walk(paginator), [product.id for product in reversed(self.products)])
+
+    def test_tampered_cursors_are_rejected(self):
+        paginator = KeysetPaginator(Product.objects.all(), ('-created_at', '-id'), per_page=3)
+
+        def encoded(values):
+            return base64.urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+        for cursor in ('not base64!', encoded({'id': 1}), encoded([1]), encoded(['yesterday', 1])):
+            with self.assertRaises(InvalidCursor, msg=cursor):
+                paginator.page(cursor)
+
+    def test_category_view_falls_back_to_first_page(self):
+        response = self.client.get(reverse('category'), {'cursor': 'garbage', 'min_price': 'cheap'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 7)
+        self.assertIn('min_price', response.context['filter_form'].errors)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("FTS5 index is SQLite-only")
+        self.phone = make_product(name='Galaxy phone')
+        self.charger = Product.objects.create(
+            category=self.phone.category, name='Wall charger', description='Fast charging for any phone',
+            price='20.00', stock=5,
+        )
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(search_product_ids('phone'), [self.phone.id, self.charger.id])
+        self.assertEqual(search_product_ids('gal'), [self.phone.id])
+        # Category names are indexed too
+        self.assertEqual(len(search_product_ids('phones')), 2)
+
+    def test_triggers_follow_writes(self):
+        Product.objects.filter(pk=self.charger.pk).update(name='Wall adapter', description='')
+        Category.objects.filter(pk=self.phone.category_id).update(name='Handsets')
+        self.phone.delete()
+
+        self.assertEqual(search_product_ids('phone'), [])
+        self.assertEqual(search_product_ids('adapter'), [self.charger.id])
+        self.assertEqual(search_product_ids('handsets'), [self.charger.id])
+
+    def test_query_syntax_is_treated_as_text(self):
+        self.assertEqual(build_match_query('phone OR "case" NEAR(x'), '"phone"* "or"* "case"* "near"* "x"*')
+        self.assertEqual(search_product_ids('"*)( NOT'), [])
+        self.assertEqual(search_product_ids('   '), [])
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        self.assertEqual(search_product_ids('phone'), [])
+
+        call_command('rebuild_search_index', stdout=io.StringIO())
+
+        self.assertEqual(search_product_ids('phone'), [self.phone.id, self.charger.id])
+
+    def test_search_view(self):
+        response = self.client.get(reverse('search'), {'q': 'charger'})
+        self.assertEqual(response.context['products'], [self.charger])
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(name='Phones', slug='phones')
+        self.laptops = Category.objects.create(name='Laptops', slug='laptops')
+        for category, price, stock in [
+            (self.phones, '3000.00', 5),
+            (self.phones, '15000.00', 0),
+            (self.phones, '15000.00', 2),
+            (self.laptops, '60000.00', 1),
+        ]:
+            Product.objects.create(category=category, name='Item', description='', price=price, stock=stock)
+
+    def test_counts_are_disjunctive(self):
+        facets = build_facets(category_id=self.phones.id, min_price=10000, in_stock=True)
+
+        counts = {category.name: category.product_count for category in facets['categories']}
+        # Category counts ignore the selected category, not the price or stock filters
+        self.assertEqual(counts, {'Laptops': 1, 'Phones': 1})
+        # The histogram ignores the price filter, not the category or stock filters
+        self.assertEqual([bucket['count'] for bucket in facets['price_buckets']], [1, 1, 0, 0, 0])
+        self.assertEqual(facets['in_stock_count'], 1)
+
+    def test_selling_out_refreshes_stock_facets(self):
+        self.assertEqual(catalog_facets()['in_stock_count'], 3)
+        user = User.objects.create_user('buyer')
+        laptop = Product.objects.get(category=self.laptops)
+        CartItem.objects.create(user=user, product=laptop, quantity=1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(new_order(user))
+
+        self.assertEqual(catalog_facets()['in_stock_count'], 2)
+        self.assertEqual(catalog_facets(in_stock=True)['price_buckets'][3]['count'], 0)
+
+    def test_histogram_links_keep_sort_and_filters(self):
+        response = self.client.get(reverse('category'), {'category': self.phones.id, 'sort': '-price'})
+        self.assertContains(
+            response,
+            f'href="?category={self.phones.id}&amp;sort=-price&amp;min_price=5000&amp;max_price=19999.99"',
+        )
+
+
+class CartServiceTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('shopper', password='password123')
+        self.cart = CartService(self.user)
+        self.phone = make_product(price='250.00')
+        self.case = make_product(price='19.99', name='Case')
+
+    def test_add_upserts_one_line(self):
+        self.cart.add(self.phone)
+        self.cart.add(self.phone, 2)
+        self.cart.add(self.case, 3)
+
+        self.assertEqual(
+            [(line.product_id, line.quantity) for line in self.cart.items()],
+            [(self.phone.id, 3), (self.case.id, 3)],
+        )
+        self.assertEqual(self.cart.total(), Decimal('809.97'))
+
+    def test_add_recovers_from_a_concurrent_insert(self):
+        atomic = transaction.atomic
+
+        @contextmanager
+        def racing_atomic():
+            # Another request inserts the line between our UPDATE and INSERT
+            CartItem.objects.create(user=self.user, product=self.phone, quantity=2)
+            with atomic():
+                yield
+
+        with mock.patch('products.cart.transaction.atomic', racing_atomic):
+            self.cart.add(self.phone, 2)
+
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+    def test_change_quantity_stops_at_one(self):
+        self.cart.add(self.phone, 2)
+        line = CartItem.objects.get()
+
+        self.assertEqual(self.cart.change_quantity(line.id, -1), 1)
+        self.assertIsNone(self.cart.change_quantity(line.id, -1))
+        self.assertEqual(self.cart.change_quantity(line.id, 1), 2)
+
+    def test_other_users_lines_are_out_of_reach(self):
+        other = CartService(User.objects.create_user('other'))
+        other.add(self.phone)
+        line = CartItem.objects.get()
+
+        with self.assertRaises(CartItem.DoesNotExist):
+            self.cart.change_quantity(line.id, 1)
+        self.assertEqual((self.cart.remove(line.id), self.cart.remove_many([line.id])), (0, 0))
+
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.post(reverse('remove_from_cart', args=[line.id])).status_code, 404)
+        self.assertEqual(
+            self.client.post(reverse('update_cart_item', args=[line.id]), {'action': 'increase'}).status_code, 404,
+        )
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+
+class CartConcurrencyTests(TransactionTestCase):
+    """Double-clicks and several tabs adding the same product at once."""
+
+    requests = 10
+
+    def setUp(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest("needs a file-backed SQLite test database")
+        self.user = User.objects.create_user('shopper')
+        self.product = make_product()
+
+    def test_concurrent_adds_are_not_lost(self):
+        barrier = threading.Barrier(self.requests)
+        errors = []
+
+        def add():
+            try:
+                barrier.wait()
+                CartService(self.user).add(self.product)
+            except Exception as exc:
+                errors.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=add) for _ in range(self.requests)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(CartItem.objects.get().quantity, self.requests)
+
+
+class CheckoutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='password123')
+
+    def test_place_order_snapshots_items_and_takes_stock(self):
+        phone = make_product(stock=5, price='250.00')
+        case = make_product(stock=2, price='20.00', name='Case')
+        CartItem.objects.create(user=self.user, product=phone, quantity=2)
+        CartItem.objects.create(user=self.user, product=case, quantity=1)
+
+        order = place_order(new_order(self.user))
+
+        self.assertEqual(order.total_price, 520)
+        self.assertEqual(order.get_total_items(), 3)
+        self.assertEqual(
+            sorted(order.orderitem_set.values_list('product__name', 'price')),
+            [('Case', 20), ('Phone', 250)],
+        )
+        phone.refresh_from_db()
+        case.refresh_from_db()
+        self.assertEqual((phone.stock, case.stock), (3, 1))
+        self.assertFalse(CartItem.objects.filter(user=self.user).exists())
+
+    def test_short_stock_rolls_back_everything(self):
+        phone = make_product(stock=5)
+        case = make_product(stock=0, name='Case')
+        CartItem.objects.create(user=self.user, product=phone, quantity=1)
+        CartItem.objects.create(user=self.user, product=case, quantity=1)
+
+        with self.assertRaises(OutOfStockError):
+            place_order(new_order(self.user))
+
+        phone.refresh_from_db()
+        self.assertEqual(phone.stock, 5)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.filter(user=self.user).count(), 2)
+
+    def test_empty_cart(self):
+        with self.assertRaises(EmptyCartError):
+            place_order(new_order(self.user))
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Flash sale: many buyers race for a handful of units."""
+
+    buyers = 20
+    stock = 5
+
+    def setUp(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest("needs a file-backed SQLite test database")
+        self.product = make_product(stock=self.stock)
+        for index in range(self.buyers):
+            user = User.objects.create_user(f'buyer{index}')
+            CartItem.objects.create(user=user, product=self.product, quantity=1)
+
+    def test_no_oversell(self):
+        users = list(User.objects.all())
+        barrier = threading.Barrier(len(users))
+        results = []
+
+        def checkout(user):
+            try:
+                barrier.wait()
+                place_order(new_order(user))
+                results.append('ok')
+            except OutOfStockError:
+                results.append('sold out')
+            except Exception as exc:
+                results.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(results.count('ok'), self.stock, results)
+        self.assertEqual(results.count('sold out'), self.buyers - self.stock, results)
+        self.assertEqual(self.product.stock, 0)
+        self.assertEqual(OrderItem.objects.count(), self.stock)
+        self.assertEqual(Order.objects.count(), self.stock)
+
+    def test_double_submit_places_one_order(self):
+        user = User.objects.get(username='buyer0')
+        barrier = threading.Barrier(2)
+        results = []
+
+        def checkout():
+            try:
+                barrier.wait()
+                place_order(new_order(user))
+                results.append('ok')
+            except EmptyCartError:
+                results.append('empty')
+            except Exception as exc:
+                results.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.product.refresh_from_db()
+        self.assertEqual(sorted(results), ['empty', 'ok'])
+        self.assertEqual(Order.objects.filter(user=user).count(), 1)
+        self.assertEqual(self.product.stock, self.stock - 1)
+
+
+class SQLiteEngineTests(TestCase):
+    def test_connection_pragmas(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest("needs a file-backed SQLite test database")
+        with connection.cursor() as cursor:
+            pragmas = {
+                name: cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                for name in ('journal_mode', 'synchronous', 'busy_timeout', 'foreign_keys')
+            }
+        # synchronous NORMAL is 1
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000, 'foreign_keys': 1})
+        self.assertEqual(connection.transaction_mode, 'IMMEDIATE')
+
+
+class StockHoldTests(TestCase):
+    def setUp(self):
+        self.product = make_product(stock=5)
+        self.case = make_product(stock=5, name='Case')
+        self.shopper = User.objects.create_user('shopper', password='password123')
+        self.other = User.objects.create_user('other')
+
+    def hold(self, user, **quantities):
+        cart = CartService(user)
+        cart.clear()
+        for name, quantity in quantities.items():
+            cart.add(getattr(self, name), quantity)
+        lines = list(cart.items())
+        hold_cart(user, lines)
+        return lines
+
+    def available(self, user=None):
+        return with_available_stock(Product.objects.filter(pk=self.product.pk), user=user).get().available_stock
+
+    def test_holds_reduce_what_others_can_buy(self):
+        self.hold(self.other, product=3)
+
+        self.assertEqual(self.available(), 2)
+        self.assertEqual(self.available(user=self.other), 5)
+        (line,) = self.hold(self.shopper, product=4)
+        # Only what is left after the other shopper's hold
+        self.assertEqual((line.available_stock, StockHold.objects.get(user=self.shopper).quantity), (2, 2))
+
+        CartItem.objects.filter(user=self.shopper).update(quantity=3)
+        with self.assertRaises(OutOfStockError):
+            place_order(new_order(self.shopper))
+
+    def test_rehold_replaces_the_previous_hold(self):
+        self.hold(self.shopper, product=2, case=1)
+        self.hold(self.shopper, product=1)
+
+        self.assertEqual(
+            list(StockHold.objects.values_list('product_id', 'quantity')), [(self.product.id, 1)],
+        )
+
+    def test_checkout_page_holds_and_order_releases(self):
+        CartService(self.shopper).add(self.product, 2)
+        self.client.force_login(self.shopper)
+
+        response = self.client.get(reverse('checkout'))
+
+        self.assertIsNotNone(response.context['hold_expires_at'])
+        self.assertEqual(self.available(), 3)
+        place_order(new_order(self.shopper))
+        self.assertFalse(StockHold.objects.exists())
+
+    def test_expired_holds_are_ignored_and_swept(self):
+        self.hold(self.other, product=3)
+        StockHold.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+
+        self.assertEqual(self.available(), 5)
+        out = io.StringIO()
+        call_command('release_expired_holds', batch_size=1, stdout=out)
+        self.assertIn('Released 1 expired holds.', out.getvalue())
+        self.assertFalse(StockHold.objects.exists())
+
+
+class StockHoldConcurrencyTests(TransactionTestCase):
+    """Shoppers reaching checkout at the same moment for scarce stock."""
+
+    shoppers = 6
+    stock = 5
+
+    def setUp(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest("needs a file-backed SQLite test database")
+        self.product = make_product(stock=self.stock)
+        for index in range(self.shoppers):
+            user = User.objects.create_user(f'shopper{index}')
+            CartItem.objects.create(user=user, product=self.product, quantity=2)
+
+    def test_holds_never_exceed_stock(self):
+        barrier = threading.Barrier(self.shoppers)
+        errors = []
+
+        def reach_checkout(user):
+            try:
+                lines = list(CartService(user).items())
+                barrier.wait()
+                hold_cart(user, lines)
+            except Exception as exc:
+                errors.append(repr(exc))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reach_checkout, args=(user,)) for user in User.objects.all()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(StockHold.objects.aggregate(total=Sum('quantity'))['total'], self.stock)
+
+
+class StubKhaltiHandler(BaseHTTPRequestHandler):
+    """Local stand-in for Khalti's verify endpoint.
+
+    Token ``good`` verifies, ``flaky`` fails once with a 503 first,
+    ``slow`` never answers within the client timeout, anything else is
+    rejected.
+    """
+
+    calls = []
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+        token = parse_qs(body)['token'][0]
+        self.calls.append(token)
+        if token == 'slow':
+            # The client has given up by now; just drop the connection
+            time.sleep(0.5)
+            return
+        if token == 'flaky':
+            status = 503 if self.calls.count('flaky') == 1 else 200
+        else:
+            status = 200 if token == 'good' else 400
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.end_headers()
+        self.wfile.write(b'{}')
+
+    def log_message(self, *args):
+        pass
+
+
+class KhaltiVerificationTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubKhaltiHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.stub_settings = override_settings(
+            KHALTI_VERIFY_URL=f'http://127.0.0.1:{cls.server.server_port}/verify/',
+            KHALTI_TIMEOUT=0.2,
+            KHALTI_RETRY_BACKOFF=0,
+        )
+        cls.stub_settings.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.stub_settings.disable()
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        StubKhaltiHandler.calls.clear()
+        self.user = User.objects.create_user('khalti', password='password123')
+        self.client.force_login(self.user)
+        CartItem.objects.create(user=self.user, product=make_product(stock=3), quantity=1)
+
+    def verify(self, token, **fields):
+        return self.client.post(reverse('verify_khalti'), {
+            'token': token,
+            'amount': '10000',
+            'delivery_address': 'Pokhara',
+            'phone_number': '9800000000',
+            **fields,
+        })
+
+    def test_verified_payment_creates_one_order(self):
+        first = self.verify('good').json()
+        second = self.verify('good').json()
+
+        self.assertTrue(first['success'])
+        self.assertEqual(first, second)
+        order = Order.objects.get()
+        self.assertEqual(order.id, first['order_id'])
+        self.assertEqual((order.payment_method, order.status), ('Khalti', 'Processing'))
+        self.assertEqual(order.get_total_items(), 1)
+        self.assertEqual(StubKhaltiHandler.calls, ['good'])
+
+    def test_query_budget(self):
+        # Claiming the token, holding the cart, then placing the order
+        self.assertQueryBudget('verify_khalti', 30, method='post', data={
+            'token': 'good', 'amount': '10000', 'delivery_address': 'Pokhara', 'phone_number': '9800000000',
+        })
+
+    def test_rejected_token(self):
+        response = self.verify('bad').json()
+
+        self.assertFalse(response['success'])
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(PaymentVerification.objects.get().status, 'Failed')
+
+    def test_amount_must_match_cart_total(self):
+        # A valid token for Rs 1 must not buy the whole cart
+        response = self.verify('good', amount='100')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(StubKhaltiHandler.calls, [])
+        self.assertFalse(PaymentVerification.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+    def test_delivery_details_are_required(self):
+        response = self.verify('good', delivery_address='', phone_number='')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'delivery_address', 'phone_number'})
+        self.assertEqual(StubKhaltiHandler.calls, [])
+        self.assertFalse(Order.objects.exists())
+
+    def test_stock_is_checked_before_payment(self):
+        other = User.objects.create_user('other')
+        product = Product.objects.get()
+        CartService(other).add(product, 3)
+        hold_cart(other, list(CartService(other).items()))
+
+        response = self.verify('good')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(StubKhaltiHandler.calls, [])
+        self.assertFalse(PaymentVerification.objects.exists())
+
+    def test_captured_payment_that_cannot_be_fulfilled_is_kept(self):
+        product = Product.objects.get()
+        with mock.patch('products.payments.place_order', side_effect=OutOfStockError(product)), \
+                self.assertLogs('products.payments', 'ERROR'):
+            response = self.verify('good')
+
+        self.assertEqual(response.status_code, 409)
+        self.assertIn('refunded', response.json()['error'])
+        verification = PaymentVerification.objects.get()
+        self.assertEqual((verification.status, verification.amount), ('Unfulfilled', 10000))
+        # Retrying can't place the order twice or hide the payment
+        self.assertEqual(self.verify('good').status_code, 409)
+        self.assertEqual(StubKhaltiHandler.calls, ['good'])
+
+    def test_stale_pending_claim_is_taken_over(self):
+        PaymentVerification.objects.create(token='good', user=self.user, amount=10000)
+
+        # Another request is still verifying
+        self.assertEqual(self.verify('good').status_code, 409)
+
+        PaymentVerification.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        response = self.verify('good').json()
+
+        self.assertTrue(response['success'])
+        self.assertEqual(PaymentVerification.objects.get().order_id, response['order_id'])
+
+    def test_client_is_closed_after_verification(self):
+        clients = []
+
+        def make_client():
+            clients.append(real_make_client())
+            return clients[-1]
+
+        real_make_client = payments.make_client
+        with mock.patch('products.payments.make_client', side_effect=make_client):
+            self.assertTrue(self.verify('good').json()['success'])
+
+        self.assertEqual(len(clients), 1)
+        self.assertTrue(clients[0].is_closed)
+
+    async def test_lifespan_shares_one_pooled_client(self):
+        clients, events, sent = [], asyncio.Queue(), asyncio.Queue()
+
+        def make_client():
+            clients.append(real_make_client())
+            return clients[-1]
+
+        real_make_client = payments.make_client
+        with mock.patch('products.payments.make_client', side_effect=make_client):
+            await events.put({'type': 'lifespan.startup'})
+            lifespan = asyncio.create_task(application({'type': 'lifespan'}, events.get, sent.put))
+            self.assertEqual(await sent.get(), {'type': 'lifespan.startup.complete'})
+            self.assertTrue(await payments.verify_token('good', 10000))
+            self.assertTrue(await payments.verify_token('good', 10000))
+            self.assertFalse(clients[0].is_closed)
+
+            await events.put({'type': 'lifespan.shutdown'})
+            self.assertEqual(await sent.get(), {'type': 'lifespan.shutdown.complete'})
+            await lifespan
+
+        self.assertEqual(len(clients), 1)
+        self.assertTrue(clients[0].is_closed)
+
+    def test_server_errors_are_retried(self):
+        response = self.verify('flaky').json()
+
+        self.assertTrue(response['success'])
+        self.assertEqual(StubKhaltiHandler.calls, ['flaky', 'flaky'])
+
+    @override_settings(KHALTI_VERIFY_RETRIES=1)
+    def test_timeout_releases_token_for_retry(self):
+        response = self.verify('slow')
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(StubKhaltiHandler.calls, ['slow', 'slow'])
+        self.assertFalse(PaymentVerification.objects.exists())
+        self.assertFalse(Order.objects.exists())
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionRefusedError("SMTP server down")
+
+
+class UnreachableEmailBackend(BaseEmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("SMTP server unreachable")
+
+    def send_messages(self, email_messages):
+        raise AssertionError("send_messages called without a connection")
+
+
+@override_settings(
+    EMAIL_BACKEND='products.outbox.OutboxEmailBackend',
+    OUTBOX_DELIVERY_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+)
+class OutboxTests(TestCase):
+    def test_send_mail_only_queues(self):
+        mail.send_mail('Order update', 'Shipped', 'shop@example.com', ['buyer@example.com'])
+
+        self.assertEqual(mail.outbox, [])
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.subject, email.to, email.status), ('Order update', ['buyer@example.com'], 'Pending'))
+
+    def test_deliver_batch_sends_queued_mail(self):
+        message = mail.EmailMultiAlternatives('Hi', 'text', 'shop@example.com', ['a@example.com'])
+        message.attach_alternative('<p>html</p>', 'text/html')
+        message.attach('receipt.pdf', b'%PDF-paid', 'application/pdf')
+        message.send()
+        mail.send_mail('Second', 'body', 'shop@example.com', ['b@example.com'])
+
+        self.assertEqual(deliver_batch(), (2, 0))
+
+        self.assertEqual([m.subject for m in mail.outbox], ['Hi', 'Second'])
+        self.assertEqual(mail.outbox[0].alternatives[0][0], '<p>html</p>')
+        self.assertEqual(mail.outbox[0].attachments[0][1], b'%PDF-paid')
+        self.assertEqual(set(OutboundEmail.objects.values_list('status', flat=True)), {'Sent'})
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    def test_sent_mail_keeps_no_body(self):
+        mail.send_mail('Password reset', 'https://shop/reset/secret-token/', 'shop@example.com', ['a@example.com'])
+
+        deliver_batch()
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.subject, email.to), ('Sent', 'Password reset', ['a@example.com']))
+        self.assertEqual((email.body, email.alternatives, email.attachments), ('', [], []))
+
+    @override_settings(OUTBOX_DELIVERY_BACKEND='products.tests.FailingEmailBackend', OUTBOX_MAX_ATTEMPTS=2)
+    def test_failures_back_off_then_dead_letter(self):
+        mail.send_mail('Hi', 'body', 'shop@example.com', ['a@example.com'])
+
+        self.assertEqual(deliver_batch(), (0, 1))
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts), ('Pending', 1))
+        self.assertIn('SMTP server down', email.last_error)
+        # Not due again until the backoff has passed
+        self.assertEqual(deliver_batch(), (0, 0))
+
+        OutboundEmail.objects.update(next_attempt_at=email.created_at)
+        self.assertEqual(deliver_batch(), (0, 1))
+        self.assertEqual(OutboundEmail.objects.get().status, 'Dead')
+
+    @override_settings(OUTBOX_DELIVERY_BACKEND='products.tests.UnreachableEmailBackend')
+    def test_unreachable_server_backs_off_the_batch(self):
+        mail.send_mail('First', 'body', 'shop@example.com', ['a@example.com'])
+        mail.send_mail('Second', 'body', 'shop@example.com', ['b@example.com'])
+
+        call_command('run_outbox', stdout=io.StringIO())
+
+        for email in OutboundEmail.objects.all():
+            self.assertEqual((email.status, email.attempts, email.lease_token), ('Pending', 1, ''))
+            self.assertIn('SMTP server unreachable', email.last_error)
+            self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=30))
+        self.assertEqual(deliver_batch(), (0, 0))
+
+    def test_password_reset_is_queued(self):
+        User.objects.create_user('reset', email='reset@example.com', password='password123')
+
+        self.client.post(reverse('password_reset'), {'email': 'reset@example.com'})
+
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboundEmail.objects.get().to, ['reset@example.com'])
+
+
+def png_upload(name='phone.png', size=(600, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, format='PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), 'image/png')
+
+
+class RenditionTests(TransactionTestCase):
+    # build_renditions closes the connection before forking its workers
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        cache.clear()
+
+    def build(self, *args):
+        out, err = io.StringIO(), io.StringIO()
+        call_command('build_renditions', '--workers=1', *args, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_saving_queues_renditions(self):
+        product = make_product(stock=1)
+        self.assertFalse(PendingRendition.objects.exists())
+        product.image = png_upload()
+        product.save()
+
+        self.assertEqual(list(PendingRendition.objects.values_list('source_name', flat=True)), [product.image.name])
+        self.assertFalse(default_storage.exists(manifest_name(product.image.name)))
+
+        out, _ = self.build('--pending')
+
+        self.assertIn('Generated 1', out)
+        self.assertTrue(default_storage.exists(manifest_name(product.image.name)))
+        self.assertFalse(PendingRendition.objects.exists())
+        self.assertIn('skipped 1', self.build('--missing')[0])
+
+    def test_queued_only_after_commit(self):
+        with transaction.atomic():
+            ProductImage.objects.create(product=make_product(stock=1), image=png_upload())
+            self.assertFalse(PendingRendition.objects.exists())
+        self.assertTrue(PendingRendition.objects.exists())
+
+    def test_missing_default_image_is_skipped_quietly(self):
+        make_product(stock=1)
+
+        with self.assertNoLogs('products', 'WARNING'):
+            out, err = self.build('--missing')
+
+        self.assertIn('missing 1', out)
+        self.assertEqual(err, '')
+
+    def test_responsive_image_checks_storage_once(self):
+        product = make_product(stock=1)
+        product.image = png_upload()
+        product.save()
+        template = Template("{% load product_images %}{% responsive_image image 'card' %}")
+
+        with mock.patch.object(default_storage, 'open', wraps=default_storage.open) as opened:
+            for _ in range(3):
+                html = template.render(Context({'image': product.image}))
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertTrue(html.startswith('<img'))
+
+        generate_renditions(product.image.name)
+
+        html = template.render(Context({'image': product.image}))
+        self.assertIn('<picture>', html)
+        self.assertIn(rendition_name(product.image.name, 'card', 'jpeg'), html)
+        # 600x300 is never upscaled to the 900px detail box
+        self.assertIn(f"{rendition_name(product.image.name, 'detail', 'jpeg')} 600w", html)
+        self.assertNotIn('900w', html)
+
+    def test_widths_of_renditions_without_them_in_the_manifest(self):
+        name = default_storage.save('products/images/tall.png', png_upload(size=(300, 600)))
+        generate_renditions(name)
+        manifest = json.loads(default_storage.open(manifest_name(name)).read())
+        del manifest['widths']
+        default_storage.delete(manifest_name(name))
+        default_storage.save(manifest_name(name), ContentFile(json.dumps(manifest).encode()))
+        cache.clear()
+
+        self.assertEqual(rendition_widths(name), {'thumb': 75, 'card': 200, 'detail': 300})
+
+
+class PaymentQRTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        qr_png.cache_clear()
+        self.user = User.objects.create_user('payer', password='password123')
+        self.client.force_login(self.user)
+        self.order = new_order(self.user)
+        self.order.total_price = 520
+        self.order.save()
+        self.order.refresh_from_db()
+
+    def test_qr_is_rendered_once_and_cached_by_clients(self):
+        url = payment_qr_url(self.order)
+
+        first = self.client.get(url)
+        second = self.client.get(url)
+
+        self.assertEqual(first['Content-Type'], 'image/png')
+        self.assertTrue(first.content.startswith(b'\x89PNG'))
+        self.assertEqual(first.content, second.content)
+        self.assertIn('immutable', first['Cache-Control'])
+        self.assertEqual(qr_png.cache_info().misses, 1)
+        not_modified = self.client.get(url, headers={'If-None-Match': first['ETag']})
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_new_total_gets_a_new_url(self):
+        old_url = payment_qr_url(self.order)
+        Order.objects.filter(pk=self.order.pk).update(total_price=600)
+        self.order.refresh_from_db()
+
+        new_url = payment_qr_url(self.order)
+        self.assertNotEqual(new_url, old_url)
+        self.assertRedirects(self.client.get(old_url), new_url, fetch_redirect_response=False)
+        self.assertIn(new_url, self.client.get(reverse('checkout_success', args=[self.order.id])).content.decode())
+
+    def test_other_users_orders_are_hidden(self):
+        other = User.objects.create_user('other', password='password123')
+        self.client.force_login(other)
+
+        response = self.client.get(payment_qr_url(self.order))
+
+        self.assertEqual(response.status_code, 404)
+
+
+class PaymentProofUploadTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root, PAYMENT_PROOF_MAX_SIZE=1024)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.user = User.objects.create_user('uploader', password='password123')
+        self.client.force_login(self.user)
+        self.product = make_product(stock=5)
+
+    def checkout(self, content):
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        return self.client.post(reverse('checkout'), {
+            'delivery_address': 'Pokhara',
+            'phone_number': '9800000000',
+            'payment_proof': SimpleUploadedFile('Proof.PNG', content, 'image/png'),
+        })
+
+    def test_identical_proofs_share_one_file(self):
+        self.checkout(b'same screenshot')
+        self.checkout(b'same screenshot')
+
+        first, second = Order.objects.order_by('id')
+        self.assertEqual(first.payment_proof.name, second.payment_proof.name)
+        self.assertEqual(first.payment_proof_sha256, second.payment_proof_sha256)
+        self.assertEqual(first.payment_proof.name, 'products/payment/{}/{}.png'.format(
+            first.payment_proof_sha256[:2], first.payment_proof_sha256))
+        self.assertEqual(first.payment_proof.read(), b'same screenshot')
+        self.assertEqual(len(default_storage.listdir(f'products/payment/{first.payment_proof_sha256[:2]}')[1]), 1)
+
+    def test_oversized_proof_is_rejected(self):
+        response = self.checkout(b'x' * 2048)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Order.objects.exists())
+        self.assertContains(response, 'smaller than')
+
+
+class CatalogImportTests(TestCase):
+    def test_duplicate_names_get_unique_slugs(self):
+        first = make_product(name='Phone')
+        second = make_product(name='Phone')
+
+        self.assertEqual((first.slug, second.slug), ('phone', 'phone-2'))
+
+    def test_import_allocates_slugs_and_upserts_by_slug(self):
+        existing = make_product(name='Phone', price='100.00')
+        rows = [
+            (2, {'name': 'Phone', 'category': 'phones', 'price': '120', 'stock': '4'}),
+            (3, {'name': 'Phone', 'category': 'Laptops', 'price': '130', 'stock': '1'}),
+            (4, {'name': 'Phone v2', 'slug': 'phone', 'category': 'Phones', 'price': '90', 'stock': '7'}),
+            (5, {'name': 'Broken', 'category': 'Phones', 'price': 'n/a', 'stock': '1'}),
+        ]
+        errors = []
+
+        result = CatalogImporter(batch_size=2).run(rows, on_error=lambda line, exc: errors.append(line))
+
+        self.assertEqual((result.rows, result.written, result.errors), (4, 3, 1))
+        self.assertEqual(errors, [5])
+        self.assertEqual(
+            sorted(Product.objects.values_list('slug', 'category__name', 'price')),
+            [('phone', 'Phones', 90), ('phone-2', 'Phones', 120), ('phone-3', 'Laptops', 130)],
+        )
+        existing.refresh_from_db()
+        self.assertEqual((existing.name, existing.stock), ('Phone v2', 7))
+
+    def test_bad_rows_are_rejected_without_stopping_the_import(self):
+        lines = [
+            {'name': 'NaN price', 'category': 'Phones', 'price': 'NaN', 'stock': 1},
+            {'name': 'Infinite price', 'category': 'Phones', 'price': 'Infinity', 'stock': 1},
+            {'name': 'Too precise', 'category': 'Phones', 'price': '1.005', 'stock': 1},
+            {'name': 'Too big', 'category': 'Phones', 'price': '123456789.50', 'stock': 1},
+            {'name': 'Negative stock', 'category': 'Phones', 'price': '10', 'stock': -1},
+            ['not', 'an', 'object'],
+            {'name': 'Bad slug', 'slug': 'Not A Slug/..', 'category': 'Phones', 'price': '10', 'stock': 1},
+            {'name': 'Good', 'category': 'Phones', 'price': '10.50', 'stock': 2},
+        ]
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as source:
+            source.write('\n'.join(json.dumps(line) for line in lines) + '\n{not json\n')
+        self.addCleanup(os.remove, source.name)
+        err = io.StringIO()
+
+        call_command('import_catalog', source.name, stdout=io.StringIO(), stderr=err)
+
+        self.assertEqual(list(Product.objects.values_list('name', 'price')), [('Good', Decimal('10.50'))])
+        rejected = err.getvalue().splitlines()
+        self.assertEqual([line.split(':')[0] for line in rejected], [f'line {n}' for n in (1, 2, 3, 4, 5, 6, 7, 9)])
+
+
+class OrderExportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', email='buyer@example.com', password='password123')
+        phone = make_product(price='250.00')
+        case = make_product(price='20.00', name='Case')
+        CartItem.objects.create(user=self.user, product=phone, quantity=2)
+        CartItem.objects.create(user=self.user, product=case, quantity=1)
+        self.order = place_order(new_order(self.user))
+        CartItem.objects.create(user=self.user, product=case, quantity=3)
+        self.cancelled = place_order(new_order(self.user))
+        Order.objects.filter(pk=self.cancelled.pk).update(status='Cancelled')
+
+    def test_command_filters_by_status(self):
+        output = io.StringIO()
+        call_command('export_orders', '--status', 'Pending', stdout=output)
+
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual(
+            [(row['order_id'], row['product_name'], row['line_total'], row['email']) for row in rows],
+            [(str(self.order.id), 'Phone', '500.00', 'buyer@example.com'),
+             (str(self.order.id), 'Case', '20.00', 'buyer@example.com')],
+        )
+
+    def test_orders_without_items_are_exported(self):
+        other = User.objects.create_user('@sum', email='sum@example.com')
+        empty = new_order(other)
+        empty.delivery_address = '=HYPERLINK("http://evil.example")'
+        empty.total_price = 0
+        empty.save()
+        output = io.StringIO()
+
+        with self.assertNumQueries(2):
+            call_command('export_orders', stdout=output)
+
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual([row['order_id'] for row in rows], [str(self.order.id)] * 2 + [str(self.cancelled.id), str(empty.id)])
+        last = rows[-1]
+        self.assertEqual((last['product_id'], last['quantity'], last['line_total']), ('', '', ''))
+        self.assertEqual(last['username'], "'@sum")
+        self.assertEqual(last['delivery_address'], '\'=HYPERLINK("http://evil.example")')
+
+    def test_admin_action_streams_selected_orders(self):
+        admin_user = User.objects.create_superuser('admin', password='password123')
+        self.client.force_login(admin_user)
+
+        response = self.client.post(reverse('admin:products_order_changelist'), {
+            'action': 'export_csv',
+            '_selected_action': [self.cancelled.id],
+        })
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Cancelled', lines[1])
+
+
+class AdminChangelistTests(TestCase):
+    # Session, user, the capped count and the page itself, plus slack for
+    # admin bookkeeping; must not grow with the number of rows.
+    ORDER_CHANGELIST_BUDGET = 6
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+
+    def add_orders(self, count):
+        for index in range(count):
+            user = User.objects.create_user(f'customer{Order.objects.count()}-{index}')
+            Order.objects.create(user=user, delivery_address='Pokhara', phone_number='1', total_price=10)
+
+    def changelist_queries(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:products_order_changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_order_changelist_query_count_is_flat(self):
+        self.add_orders(3)
+        few = self.changelist_queries()
+        self.add_orders(30)
+        many = self.changelist_queries()
+
+        self.assertEqual(few, many)
+        self.assertLessEqual(many, self.ORDER_CHANGELIST_BUDGET)
+        self.assertLessEqual(self.changelist_queries(status__exact='Pending', q='customer1'), self.ORDER_CHANGELIST_BUDGET + 1)
+
+    def test_order_search_by_number(self):
+        self.add_orders(2)
+        order = Order.objects.last()
+
+        response = self.client.get(reverse('admin:products_order_changelist'), {'q': str(order.id)})
+
+        self.assertEqual(list(response.context['cl'].result_list), [order])
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def setUp(self):
+        products = [make_product(name=f'Product {index}') for index in range(12)]
+        Product.objects.filter(id__in=[product.id for product in products[3:8]]).delete()
+        self.products = Product.objects.order_by('id')
+
+    def paginator(self, count_limit):
+        paginator = EstimatedCountPaginator(self.products, per_page=3)
+        paginator.count_limit = count_limit
+        return paginator
+
+    def test_short_lists_are_counted_exactly(self):
+        self.assertEqual(self.paginator(count_limit=20).count, 7)
+
+    def test_overshooting_estimate_is_clamped_on_an_empty_page(self):
+        paginator = self.paginator(count_limit=5)
+        # The rowid span still covers the deleted rows
+        self.assertEqual((paginator.count, paginator.num_pages), (12, 4))
+
+        self.assertEqual(len(paginator.page(3).object_list), 1)
+        with self.assertRaises(EmptyPage):
+            paginator.page(4)
+        self.assertEqual(paginator.num_pages, 3)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='password123')
+        laptops = Category.objects.create(name='Laptops', slug='laptops')
+        self.phone = make_product(price='250.00')
+        self.laptop = Product.objects.create(category=laptops, name='Laptop', description='', price='900.00', stock=5)
+
+    def buy(self, *lines):
+        for product, quantity in lines:
+            CartItem.objects.create(user=self.user, product=product, quantity=quantity)
+        return place_order(new_order(self.user))
+
+    def rollups(self):
+        return sorted(DailySalesRollup.objects.values_list('category__name', 'status', 'revenue', 'units', 'order_count'))
+
+    def test_rollups_follow_checkout_status_changes_and_deletes(self):
+        order = self.buy((self.phone, 2), (self.laptop, 1))
+        self.buy((self.phone, 1))
+        self.assertEqual(self.rollups(), [
+            ('Laptops', 'Pending', 900, 1, 1),
+            ('Phones', 'Pending', 750, 3, 2),
+        ])
+
+        order.status = 'Shipped'
+        order.save()
+        self.assertEqual(self.rollups(), [
+            ('Laptops', 'Shipped', 900, 1, 1),
+            ('Phones', 'Pending', 250, 1, 1),
+            ('Phones', 'Shipped', 500, 2, 1),
+        ])
+
+        Order.objects.get(pk=order.pk).delete()
+        self.assertEqual(self.rollups(), [('Phones', 'Pending', 250, 1, 1)])
+
+    def test_rebuild_matches_incremental_rollups(self):
+        order = self.buy((self.phone, 2), (self.laptop, 1))
+        self.buy((self.phone, 1), (self.laptop, 2))
+        order.status = 'Delivered'
+        order.save()
+        incremental = self.rollups()
+
+        today = order.created_at.date()
+        rebuild_rollups(today, today)
+
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_orders_built_outside_checkout_are_counted(self):
+        self.buy((self.phone, 1))
+        order = Order.objects.create(user=self.user, delivery_address='Pokhara', phone_number='1', total_price=0)
+        phone_item = OrderItem.objects.create(order=order, product=self.phone, quantity=2, price='250.00')
+        OrderItem.objects.create(order=order, product=self.phone, quantity=1, price='250.00')
+        OrderItem.objects.create(order=order, product=self.laptop, quantity=1, price='900.00')
+        self.assertEqual(self.rollups(), [
+            ('Laptops', 'Pending', 900, 1, 1),
+            ('Phones', 'Pending', 1000, 4, 2),
+        ])
+
+        # The first status change moves what was added, not less
+        order.status = 'Shipped'
+        order.save()
+        phone_item.delete()
+        self.assertEqual(self.rollups(), [
+            ('Laptops', 'Shipped', 900, 1, 1),
+            ('Phones', 'Pending', 250, 1, 1),
+            ('Phones', 'Shipped', 250, 1, 1),
+        ])
+
+        Order.objects.get(pk=order.pk).delete()
+        self.assertEqual(self.rollups(), [('Phones', 'Pending', 250, 1, 1)])
+        self.user.delete()
+        self.assertEqual(self.rollups(), [])
+
+    def test_dashboard_reads_rollups(self):
+        self.buy((self.phone, 2))
+        self.client.force_login(User.objects.create_superuser('admin', password='password123'))
+
+        response = self.client.get(reverse('admin:products_dailysalesrollup_changelist'))
+
+        self.assertEqual(response.context['monthly_sales'][0]['revenue'], 500)
+        self.assertContains(response, 'Revenue by month')
+
+
+class VerifiedPurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('buyer', password='password123')
+        self.product = make_product()
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.order = place_order(new_order(self.user))
+        self.client.force_login(self.user)
+
+    def detail(self):
+        return self.client.get(reverse('product_detail', args=[self.product.slug]))
+
+    def test_delivery_makes_the_buyer_eligible_to_review(self):
+        self.assertFalse(self.detail().context['can_review'])
+
+        self.order.status = 'Delivered'
+        self.order.save()
+
+        self.assertTrue(VerifiedPurchase.objects.filter(user=self.user, product=self.product).exists())
+        self.assertTrue(self.detail().context['can_review'])
+
+    def test_reviews_carry_a_verified_badge(self):
+        Order.objects.filter(pk=self.order.pk).update(status='Delivered')
+        self.assertEqual(backfill_verified_purchases(), 1)
+        stranger = User.objects.create_user('stranger')
+        Review.objects.create(product=self.product, user=self.user, rating=5)
+        Review.objects.create(product=self.product, user=stranger, rating=1)
+
+        reviews = {review.user.username: review.verified_buyer for review in self.detail().context['reviews']}
+
+        self.assertEqual(reviews, {'buyer': True, 'stranger': False})
+
+
+class ProductReviewTests(TestCase):
+    def setUp(self):
+        self.product = make_product()
+        for index in range(25):
+            user = User.objects.create_user(f'reviewer{index}')
+            Review.objects.create(product=self.product, user=user, rating=index % 5 + 1, comment=f'review {index}')
+
+    def test_reviews_are_paginated_and_the_fragment_continues(self):
+        response = self.client.get(reverse('product_detail', args=[self.product.slug]), {'review_sort': 'highest'})
+        first = response.context['reviews']
+        self.assertEqual(len(first), 10)
+        self.assertEqual({review.rating for review in first}, {5, 4})
+        self.assertEqual(response.context['rating_histogram'][0], (5, 5, 20))
+
+        seen = [review.id for review in first]
+        cursor = first.next_cursor
+        while cursor:
+            fragment = self.client.get(reverse('product_reviews', args=[self.product.slug]), {
+                'review_sort': 'highest', 'review_cursor': cursor,
+            })
+            page = fragment.context['reviews']
+            seen += [review.id for review in page]
+            cursor = page.next_cursor
+
+        self.assertEqual(len(seen), 25)
+        self.assertEqual(set(seen), set(Review.objects.values_list('id', flat=True)))
+
+    def test_review_page_query_count_is_flat(self):
+        url = reverse('product_detail', args=[self.product.slug])
+        # Product, the review page (users and badges joined in), nothing per review
+        with self.assertNumQueries(2):
+            self.client.get(url)
+
+
+class OrderHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('regular', password='password123')
+        self.phone = make_product(stock=1000, price='250.00')
+        self.case = make_product(stock=1000, price='20.00', name='Case')
+        self.client.force_login(self.user)
+
+    def add_orders(self, count):
+        for _ in range(count):
+            CartItem.objects.create(user=self.user, product=self.phone, quantity=2)
+            CartItem.objects.create(user=self.user, product=self.case, quantity=1)
+            place_order(new_order(self.user))
+
+    def profile_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_history_is_annotated_and_paged(self):
+        self.add_orders(12)
+
+        first = order_history(self.user)
+        second = order_history(self.user, first.next_cursor)
+
+        self.assertEqual((len(first), len(second), second.has_next), (10, 2, False))
+        order = first.object_list[0]
+        self.assertEqual((order.item_count, order.items_total), (3, 520))
+        self.assertEqual(
+            [(item.product.name, item.line_total) for item in order.page_items],
+            [('Phone', 500), ('Case', 20)],
+        )
+        ids = [order.id for order in first] + [order.id for order in second]
+        self.assertEqual(ids, list(Order.objects.order_by('-created_at', '-id').values_list('id', flat=True)))
+
+    def test_profile_query_count_does_not_grow_with_history(self):
+        self.add_orders(2)
+        few = self.profile_queries()
+        self.add_orders(20)
+
+        self.assertEqual(self.profile_queries(), few)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaRouterTests(SimpleTestCase):
+    router = ReplicaRouter()
+
+    def routed_read(self, request):
+        """Where Product reads go while handling ``request``."""
+        seen = []
+
+        def view(request):
+            seen.append(self.router.db_for_read(Product))
+            if 'write' in request.GET:
+                self.router.db_for_write(CartItem)
+                seen.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(view)(request)
+        return seen, response
+
+    def test_catalog_reads_use_replica(self):
+        seen, response = self.routed_read(RequestFactory().get('/'))
+        self.assertEqual(seen, ['replica'])
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+        # Not a catalog model
+        self.assertIsNone(self.router.db_for_read(User))
+
+    def test_unsafe_request_pins_and_sets_cookie(self):
+        seen, response = self.routed_read(RequestFactory().post('/'))
+        self.assertEqual(seen, ['default'])
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], 5)
+
+    def test_write_pins_rest_of_request(self):
+        seen, response = self.routed_read(RequestFactory().get('/', {'write': 1}))
+        self.assertEqual(seen, ['replica', 'default'])
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pin_cookie_reads_own_writes(self):
+        factory = RequestFactory()
+        factory.cookies[PIN_COOKIE] = '1'
+        seen, _ = self.routed_read(factory.get('/'))
+        self.assertEqual(seen, ['default'])
+
+    def test_primary_reads_block(self):
+        seen = []
+
+        def view(request):
+            with primary_reads():
+                seen.append(self.router.db_for_read(Product))
+            seen.append(self.router.db_for_read(Product))
+            return HttpResponse()
+
+        ReplicaPinMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(seen, ['default', 'replica'])
+
+
+    def test_relations_only_within_the_replica_set(self):
+        def on(alias, obj):
+            obj._state.db = alias
+            return obj
+
+        self.assertTrue(self.router.allow_relation(on('replica', Product()), on('default', Category())))
+        self.assertIsNone(self.router.allow_relation(on('archive', Product()), on('default', Category())))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'], REPLICA_PIN_SECONDS=5)
+class ReplicaIntegrationTests(TransactionTestCase):
+    """The router against a second SQLite file standing in for a lagging replica."""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite' or connection.is_in_memory_db():
+            self.skipTest("needs a file-backed SQLite test database")
+        self.user = User.objects.create_user('reader', password='password123')
+        self.replicated = make_product(name='Replicated')
+        self.replicated_order = new_order(self.user)
+        self.replicated_order.total_price = 10
+        self.replicated_order.save()
+
+        # Snapshot the primary into the replica file, then let the
+        # primary move ahead
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        replica_name = os.path.join(directory, 'replica.sqlite3')
+        connection.ensure_connection()
+        with closing(sqlite3.connect(replica_name)) as snapshot:
+            connection.connection.backup(snapshot)
+        replica = type(connections['default'])({**connection.settings_dict, 'NAME': replica_name}, alias='replica')
+        connections['replica'] = replica
+        self.addCleanup(connections.__delitem__, 'replica')
+        self.addCleanup(replica.close)
+
+        self.unreplicated = make_product(name='Unreplicated')
+        self.unreplicated_order = new_order(self.user)
+        self.unreplicated_order.total_price = 20
+        self.unreplicated_order.save()
+
+    def handle(self, request, view):
+        seen = {}
+
+        def wrapped(request):
+            seen.update(view(request))
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(wrapped)(request)
+        return seen, response
+
+    def product_names(self, request):
+        return {'names': set(Product.objects.values_list('name', flat=True))}
+
+    def test_reads_go_to_the_replica_file(self):
+        seen, _ = self.handle(RequestFactory().get('/'), self.product_names)
+
+        self.assertEqual(seen['names'], {'Replicated'})
+
+    def test_write_pins_later_reads_to_the_primary(self):
+        def view(request):
+            before = set(Product.objects.values_list('name', flat=True))
+            CartItem.objects.create(user=self.user, product=self.unreplicated, quantity=1)
+            return {'before': before, **self.product_names(request)}
+
+        seen, response = self.handle(RequestFactory().get('/'), view)
+
+        self.assertEqual(seen['before'], {'Replicated'})
+        self.assertEqual(seen['names'], {'Replicated', 'Unreplicated'})
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+    def test_pin_cookie_covers_order_history(self):
+        def view(request):
+            return {'orders': set(Order.objects.filter(user=self.user).values_list('id', flat=True))}
+
+        unpinned, _ = self.handle(RequestFactory().get('/'), view)
+        factory = RequestFactory()
+        factory.cookies[PIN_COOKIE] = '1'
+        pinned, _ = self.handle(factory.get('/'), view)
+
+        self.assertEqual(unpinned['orders'], {self.replicated_order.id})
+        self.assertEqual(pinned['orders'], {self.replicated_order.id, self.unreplicated_order.id})
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Query budgets for the shop pages, with enough rows to expose an N+1."""
+
+    rows = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user('regular', password='password123')
+        self.products = [make_product(stock=100, name=f'Phone {index}') for index in range(self.rows)]
+        for index, product in enumerate(self.products):
+            reviewer = User.objects.create_user(f'reviewer{index}')
+            Review.objects.create(product=self.products[0], user=reviewer, rating=4, comment='Good')
+            CartItem.objects.create(user=self.user, product=product, quantity=1)
+        self.order = place_order(new_order(self.user))
+        for product in self.products:
+            CartItem.objects.create(user=self.user, product=product, quantity=1)
+        self.client.force_login(self.user)
+
+    def test_catalog_pages(self):
+        slug = self.products[0].slug
+        self.assertQueryBudget('homepage', 7)
+        self.assertQueryBudget('category', 4)
+        self.assertQueryBudget('search', 4, data={'q': 'phone'})
+        self.assertQueryBudget('product_detail', 6, args=[slug])
+        self.assertQueryBudget('product_reviews', 2, args=[slug])
+
+    def test_cart(self):
+        self.assertQueryBudget('cart', 4)
+
+    def test_cart_changes(self):
+        items = list(CartItem.objects.filter(user=self.user).values_list('id', flat=True))
+        self.assertQueryBudget('add_to_cart', 4, args=[self.products[0].id], method='post', status=302)
+        self.assertQueryBudget(
+            'update_cart_item', 4, args=[items[0]], method='post', data={'action': 'increase'}, status=302,
+        )
+        self.assertQueryBudget('remove_from_cart', 3, args=[items[0]], method='post', status=302)
+        self.assertQueryBudget(
+            'bulk_delete_cart', 3, method='post', data={'selected_items': items[1:]}, status=302,
+        )
+
+    def test_order_pages(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.assertQueryBudget('checkout_success', 3, args=[self.order.id])
+        self.order.refresh_from_db()
+        digest = payload_digest(payment_payload(self.order))
+        self.assertQueryBudget('order_payment_qr', 3, args=[self.order.id, digest])
+
+    def test_checkout(self):
+        # Includes the hold transaction's availability re-read and, under
+        # TestCase, its savepoint pair
+        self.assertQueryBudget('checkout', 9)
+
+    def test_profile(self):
+        self.assertQueryBudget('profile', 6)
+
+
+class InstrumentationTests(TestCase):
+    def test_fingerprint_ignores_literals(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id = 12 AND name = 'x' AND k IN (%s, %s) LIMIT 21"),
+            fingerprint("SELECT *  FROM t WHERE id = 7 AND name = 'it''s' AND k IN (%s) LIMIT 1"),
+        )
+
+    def test_server_timing_and_log_line(self):
+        make_product()
+        with self.assertLogs('ecommerce.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('homepage'))
+
+        self.assertRegex(
+            response['Server-Timing'],
+            r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+, app;dur=[\d.]+$',
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual((record['url_name'], record['status'], logs.records[0].levelname), ('homepage', 200, 'INFO'))
+        self.assertGreater(record['queries'], 0)
+        self.assertGreater(record['template_ms'], 0)
+
+    def test_streaming_responses_are_marked(self):
+        def rows():
+            yield from Product.objects.values_list('name', flat=True)
+
+        def view(request):
+            return StreamingHttpResponse(rows())
+
+        with self.assertLogs('ecommerce.instrumentation', 'INFO') as logs:
+            response = QueryInstrumentationMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertIn('"0 queries before streaming"', response['Server-Timing'])
+        self.assertTrue(json.loads(logs.records[0].getMessage())['streaming'])
+
+    def test_savepoints_are_not_flagged(self):
+        def view(request):
+            # Nested in the test's transaction, so each one is a savepoint
+            for _ in range(5):
+                with transaction.atomic():
+                    pass
+            return HttpResponse()
+
+        with self.assertLogs('ecommerce.instrumentation', 'INFO') as logs:
+            QueryInstrumentationMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertEqual(logs.records[0].levelname, 'INFO')
+        self.assertNotIn('repeated_queries', json.loads(logs.records[0].getMessage()))
+
+    async def test_async_request_counts_queries_in_sync_threads(self):
+        # Under ASGI sync code runs in another thread, with its own connections
+        def count():
+            try:
+                return Product.objects.count()
+            finally:
+                connection.close()
+
+        async def view(request):
+            await sync_to_async(count, thread_sensitive=False)()
+            return HttpResponse()
+
+        with self.assertLogs('ecommerce.instrumentation', 'INFO') as logs:
+            await QueryInstrumentationMiddleware(view)(AsyncRequestFactory().get('/'))
+
+        self.assertEqual(json.loads(logs.records[0].getMessage())['queries'], 1)
+
+    def test_middleware_is_async_capable(self):
+        # One sync-only middleware makes ASGI hold a thread per request
+        for path in settings.MIDDLEWARE:
+            with self.subTest(path):
+                self.assertTrue(import_string(path).async_capable)
+
+    def test_repeated_queries_are_flagged(self):
+        ids = [make_product(name=f'Phone {index}').pk for index in range(5)]
+
+        def view(request):
+            for pk in ids:
+                Product.objects.get(pk=pk)
+            return HttpResponse()
+
+        with self.assertLogs('ecommerce.instrumentation', 'WARNING') as logs:
+            QueryInstrumentationMiddleware(view)(RequestFactory().get('/'))
+
+        (repeated,) = json.loads(logs.records[0].getMessage())['repeated_queries']
+        self.assertEqual(repeated['count'], 5)
+        self.assertIn('FROM "products_product"', repeated['sql'])
 
-# Create your tests here.
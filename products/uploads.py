@@ -0,0 +1,105 @@
+# products/uploads.py
+#
+# Payment proof uploads. PaymentProofUploadHandler streams the
+# ``payment_proof`` field straight to a temporary file while hashing it
+# and gives up as soon as the size cap is passed. store_payment_proof()
+# then files it under its SHA-256, so a customer resubmitting the same
+# screenshot reuses the file already on disk.
+
+import hashlib
+import posixpath
+import re
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile, StopFutureHandlers
+
+PAYMENT_PROOF_FIELD = 'payment_proof'
+PAYMENT_PROOF_ROOT = 'products/payment'
+_EXTENSION = re.compile(r'^\.[a-z0-9]{1,5}$')
+
+
+class PaymentProofUploadHandler(FileUploadHandler):
+    """Hash and size-check the payment proof as it streams in.
+
+    Other file fields are left to the handlers after this one. Must be
+    installed before anything reads ``request.POST``.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.max_size = settings.PAYMENT_PROOF_MAX_SIZE
+        self.too_large = False
+        self.active = False
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # The whole body is too big: don't read any of it into a file
+        self.too_large = content_length > self.max_size + 64 * 1024
+
+    def new_file(self, field_name, *args, **kwargs):
+        super().new_file(field_name, *args, **kwargs)
+        self.active = field_name == PAYMENT_PROOF_FIELD
+        if not self.active:
+            return
+        if self.too_large:
+            raise SkipFile()
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+        self.file = TemporaryUploadedFile(
+            self.file_name, self.content_type, 0, self.charset, self.content_type_extra,
+        )
+        raise StopFutureHandlers()
+
+    def receive_data_chunk(self, raw_data, start):
+        if not self.active:
+            return raw_data
+        self.size += len(raw_data)
+        if self.size > self.max_size:
+            self.too_large = True
+            self.active = False
+            self.file.close()
+            raise SkipFile()
+        self.sha256.update(raw_data)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        if not self.active:
+            return None
+        self.active = False
+        self.file.seek(0)
+        self.file.size = file_size
+        self.file.sha256 = self.sha256.hexdigest()
+        return self.file
+
+
+def file_sha256(uploaded):
+    """SHA-256 of an uploaded file, reusing the one computed while streaming."""
+    digest = getattr(uploaded, 'sha256', None)
+    if digest:
+        return digest
+    sha256 = hashlib.sha256()
+    for chunk in uploaded.chunks():
+        sha256.update(chunk)
+    uploaded.seek(0)
+    return sha256.hexdigest()
+
+
+def payment_proof_name(digest, original_name):
+    extension = posixpath.splitext(original_name or '')[1].lower()
+    if not _EXTENSION.match(extension):
+        extension = ''
+    return f'{PAYMENT_PROOF_ROOT}/{digest[:2]}/{digest}{extension}'
+
+
+def store_payment_proof(order, uploaded):
+    """Attach ``uploaded`` to ``order`` under a content-addressed name."""
+    digest = file_sha256(uploaded)
+    name = payment_proof_name(digest, uploaded.name)
+    if not default_storage.exists(name):
+        saved = default_storage.save(name, uploaded)
+        if saved != name:
+            # Lost a race with an identical upload; keep the first copy
+            default_storage.delete(saved)
+    order.payment_proof = name
+    order.payment_proof_sha256 = digest
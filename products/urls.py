@@ -6,14 +6,17 @@ from django.conf.urls.static import static
 urlpatterns = [
     path('', views.homepage, name='homepage'),
     path('category/', views.category, name='category'),
+    path('search/', views.search, name='search'),
     path('cart/', views.cart, name='cart'),
     path('product/<slug:slug>/', views.detail, name='product_detail'),
+    path('product/<slug:slug>/reviews/', views.product_reviews, name='product_reviews'),
     path('add_to_cart/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('checkout/',views.checkout, name='checkout'),
     path('remove_from_cart/<int:item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('update_cart_item/<int:item_id>/', views.update_cart_item, name='update_cart_item'),
     path('bulk_delete_cart/', views.bulk_delete_cart, name='bulk_delete_cart'),
     path('checkout/success/<int:order_id>/', views.checkout_success, name='checkout_success'),
+    path('orders/<int:order_id>/qr/<str:digest>.png', views.order_payment_qr, name='order_payment_qr'),
     path('products/', views.products, name='products'),
     path('profile/', views.profile, name='profile'),
     path('verify-khalti/', views.verify_khalti, name='verify_khalti'),
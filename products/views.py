@@ -1,67 +1,93 @@
-from products.models import Category, Product,CartItem, Order, UserProfile, OrderItem
+from products.models import Category, Product,CartItem, Order, UserProfile, OrderItem, PaymentVerification
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render,redirect
 from django.shortcuts import get_object_or_404
 from django.contrib import messages
 from django.conf import settings
-import qrcode
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import redirect
 from django.core.files.storage import FileSystemStorage
-from django.db import models
 from django.db.models import Count
-import requests
-from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-
+from django.http import Http404, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from asgiref.sync import sync_to_async
+
+from .cache import cached_section
+from .cart import CartService
+from .checkout import CheckoutError, place_order
+from .facets import catalog_facets
 from .forms import *
+from .inventory import hold_cart
+from .payments import (
+    KhaltiUnavailable, claim_expired, claim_token, complete_order, fail_verification, hold_cart_for_payment,
+    mark_unfulfilled, verify_token,
+)
+from .orders import history_context
+from .pagination import InvalidCursor, KeysetPaginator
+from .qr import payload_digest, payment_payload, payment_qr_url, qr_png
+from .recommendations import recommend_for_user
+from .reviews import REVIEW_SORTS, has_verified_purchase, review_page
+from .search import search_products
+from .uploads import PaymentProofUploadHandler, store_payment_proof
+
+PRODUCTS_PER_PAGE = 24
 
 def homepage(request):
+    # Anonymous sections are cached under the catalog version, so a warm
+    # homepage costs no catalog queries. See products/cache.py.
+
     # Featured Products (most reviewed)
-    featured_products = Product.objects.annotate(
-        review_count=Count('reviews')
-    ).order_by('-review_count')[:4]
+    featured_products = cached_section(
+        'home:featured',
+        lambda: Product.objects.order_by('-rating_count')[:4],
+    )
     
     # New Arrivals
-    new_arrivals = Product.objects.order_by('-created_at')[:4]
+    new_arrivals = cached_section(
+        'home:new_arrivals',
+        lambda: Product.objects.order_by('-created_at')[:4],
+    )
     
     # Popular Categories
-    popular_categories = Category.objects.annotate(
-        product_count=Count('products')
-    ).order_by('-product_count')[:6]
+    popular_categories = cached_section(
+        'home:popular_categories',
+        lambda: Category.objects.annotate(
+            product_count=Count('products')
+        ).order_by('-product_count')[:6],
+    )
     
     # Recommendations for logged-in users
     recommended_products = []
     if request.user.is_authenticated:
         try:
-            # Get user's purchase history
-            user_orders = Order.objects.filter(
-                user=request.user,
-                status='Delivered'
-            )
-            
-            if user_orders.exists():
-                # Get categories from user's orders
-                user_categories = OrderItem.objects.filter(
-                    order__in=user_orders
-                ).values_list('product__category', flat=True).distinct()
+            # Precomputed co-purchase neighbours (see build_recommendations)
+            recommended_products = recommend_for_user(request.user)
+            if not recommended_products:
+                # Cold start: fall back to the categories of delivered orders
+                user_orders = Order.objects.filter(
+                    user=request.user,
+                    status='Delivered'
+                )
                 
-                # Recommend products from similar categories
-                recommended_products = Product.objects.filter(
-                    category__in=user_categories
-                ).exclude(
-                    orderitem__order__user=request.user
-                ).order_by('?')[:4]
-            else:
-                # If no order history, show popular products
-                recommended_products = Product.objects.annotate(
-                    review_count=Count('reviews')
-                ).order_by('-review_count')[:4]
+                if user_orders.exists():
+                    # Get categories from user's orders
+                    user_categories = OrderItem.objects.filter(
+                        order__in=user_orders
+                    ).values_list('product__category', flat=True).distinct()
+                    
+                    # Recommend well-reviewed products from similar categories
+                    recommended_products = Product.objects.filter(
+                        category__in=user_categories
+                    ).exclude(
+                        orderitem__order__user=request.user
+                    ).order_by('-rating_count')[:4]
+                else:
+                    # If no order history, show popular products
+                    recommended_products = featured_products
         except:
             # Fallback to popular products if there's any error
-            recommended_products = Product.objects.annotate(
-                review_count=Count('reviews')
-            ).order_by('-review_count')[:4]
+            recommended_products = featured_products
     
     context = {
         'featured_products': featured_products,
@@ -74,8 +100,9 @@ def products(request):
     return render(request, 'products/products.html')
 @login_required(login_url='login')
 def cart(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    total_price = sum(item.product.price * item.quantity for item in cart_items)
+    cart = CartService(request.user)
+    cart_items = list(cart.items())
+    total_price = cart.total()
     
     context = {
         'cart_items': cart_items,
@@ -85,22 +112,13 @@ def cart(request):
 
 def detail(request, slug):
     product = get_object_or_404(Product, slug=slug)
-    reviews = product.reviews.all().order_by('-created_at')
     user_review = None
     can_review = False
     
     if request.user.is_authenticated:
-        # Check if user has a delivered order containing this product
-        delivered_orders = Order.objects.filter(
-            user=request.user,
-            status='Delivered'
-        )
-        has_delivered_order = any(
-            product in order.orderitem_set.values_list('product', flat=True) 
-            for order in delivered_orders
-        )
-        user_review = reviews.filter(user=request.user).first()
-        can_review = has_delivered_order and not user_review
+        # One indexed lookup in the verified-purchase table
+        user_review = product.reviews.filter(user=request.user).first()
+        can_review = not user_review and has_verified_purchase(request.user, product)
     
     if request.method == 'POST' and request.user.is_authenticated:
         # Recheck delivery status when submitting review
@@ -123,12 +141,17 @@ def detail(request, slug):
     else:
         form = ReviewForm(instance=user_review) if user_review else ReviewForm()
     
-    # Calculate average rating
-    avg_rating = reviews.aggregate(models.Avg('rating'))['rating__avg']
+    # Average rating is stored on the product, no aggregate needed
+    avg_rating = product.get_average_rating()
+    review_sort = request.GET.get('review_sort', 'newest')
+    reviews = review_page(product, review_sort, request.GET.get('review_cursor'))
     
     context = {
         'product': product,
         'reviews': reviews,
+        'review_sort': review_sort,
+        'review_sorts': REVIEW_SORTS,
+        'rating_histogram': rating_histogram(product),
         'form': form,
         'user_review': user_review,
         'avg_rating': avg_rating,
@@ -136,58 +159,127 @@ def detail(request, slug):
     }
     return render(request, 'products/detail.html', context)
 
+
+def product_reviews(request, slug):
+    """Next page of reviews as an HTML fragment, for infinite scroll."""
+    product = get_object_or_404(Product.objects.only('id', 'slug'), slug=slug)
+    review_sort = request.GET.get('review_sort', 'newest')
+    context = {
+        'product': product,
+        'reviews': review_page(product, review_sort, request.GET.get('review_cursor')),
+        'review_sort': review_sort,
+    }
+    return render(request, 'products/review_list.html', context)
+
+
+def rating_histogram(product):
+    """[(stars, count, percent), ...] from the stored rating columns."""
+    total = product.rating_count or 1
+    return [(stars, count, round(100 * count / total)) for stars, count in product.get_rating_histogram()]
+
     
+# Keyset orderings for the category listing; each is backed by a
+# (category, <field>, id) index and a global (<field>, id) index.
+CATEGORY_SORTS = {
+    'newest': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+
+
 def category(request):
-    categories = Category.objects.all()  # Get all categories
+    # Invalid filter values are reported and ignored, never passed to the query
+    filter_form = ProductFilterForm(request.GET)
+    filter_form.is_valid()
+    filters = filter_form.cleaned_data
+
+    # Category, price and stock facet counts (one grouped query, cached)
+    facets = catalog_facets(
+        category_id=filters.get('category'),
+        min_price=filters.get('min_price'),
+        max_price=filters.get('max_price'),
+        in_stock=filters.get('in_stock', False),
+    )
 
     # Filter products based on category and price range
     products = Product.objects.all()
 
     # Filter by category if selected
-    category_id = request.GET.get('category')
-    if category_id:
-        products = products.filter(category_id=category_id)
+    if filters.get('category'):
+        products = products.filter(category_id=filters['category'])
 
     # Filter by min price if provided
-    min_price = request.GET.get('min_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
+    if filters.get('min_price') is not None:
+        products = products.filter(price__gte=filters['min_price'])
 
     # Filter by max price if provided
-    max_price = request.GET.get('max_price')
-    if max_price:
-        products = products.filter(price__lte=max_price)
-
-    # Pass the filtered products and categories to the template
+    if filters.get('max_price') is not None:
+        products = products.filter(price__lte=filters['max_price'])
+
+    # Only products that can be bought right now
+    if filters.get('in_stock'):
+        products = products.filter(stock__gt=0)
+
+    paginator = KeysetPaginator(
+        products,
+        CATEGORY_SORTS[filters.get('sort') or 'newest'],
+        per_page=PRODUCTS_PER_PAGE,
+    )
+    try:
+        page = paginator.page(request.GET.get('cursor'))
+    except InvalidCursor:
+        page = paginator.page()
+
+    next_page_url = None
+    if page.has_next:
+        params = request.GET.copy()
+        params['cursor'] = page.next_cursor
+        next_page_url = f"?{params.urlencode()}"
+
+    first_page_url = None
+    if 'cursor' in request.GET:
+        params = request.GET.copy()
+        del params['cursor']
+        first_page_url = f"?{params.urlencode()}"
+
+    # Pass the current page of products and categories to the template
     return render(request, 'products/category.html', {
-        'categories': categories,
-        'products': products
+        'categories': facets['categories'],
+        'price_buckets': facets['price_buckets'],
+        'in_stock_count': facets['in_stock_count'],
+        'products': page,
+        'filter_form': filter_form,
+        'sort_choices': ProductFilterForm.SORT_CHOICES,
+        'next_page_url': next_page_url,
+        'first_page_url': first_page_url,
+    })
+
+SEARCH_RESULTS_LIMIT = 48
+
+
+def search(request):
+    query = request.GET.get('q', '').strip()[:100]
+    results = search_products(query, limit=SEARCH_RESULTS_LIMIT) if query else []
+    return render(request, 'products/search.html', {
+        'query': query,
+        'products': results,
     })
 
 @login_required
 def add_to_cart(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
+    product = get_object_or_404(Product.objects.only('id'), id=product_id)
     
     # Get the quantity from the POST request and set a default of 1 if not provided
     quantity = request.POST.get('quantity')
     
-    if not quantity or int(quantity) <= 0:
+    if not quantity or not quantity.isdigit() or int(quantity) <= 0:
         quantity = 1  # Default to 1 if quantity is invalid or missing
 
     # Ensure quantity is treated as an integer
     quantity = int(quantity)
 
-    # Retrieve the cart item or create a new one
-    cart_item, created = CartItem.objects.get_or_create(user=request.user, product=product)
-
-    if not created:
-        # If the cart item already exists, update the quantity
-        cart_item.quantity += quantity
-        cart_item.save()
-    else:
-        # If the cart item is new, set the quantity
-        cart_item.quantity = quantity
-        cart_item.save()
+    # Atomic upsert: increments an existing line or creates a new one
+    CartService(request.user).add(product, quantity)
 
     return redirect('cart')  # Redirect to the cart page
 
@@ -195,33 +287,60 @@ def add_to_cart(request, product_id):
 
 from django.core.files.storage import FileSystemStorage
 
+@csrf_exempt
 @login_required(login_url='login')
 def checkout(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    total_price = sum(item.product.price * item.quantity for item in cart_items)
-    qr_code_path = f"{settings.MEDIA_URL}qr_codes/order_payment_qr.png"  # Update this to your static QR path
+    # The handler has to be installed before the CSRF check reads
+    # request.POST, so CSRF is enforced on the inner view instead.
+    proof_handler = PaymentProofUploadHandler(request)
+    request.upload_handlers.insert(0, proof_handler)
+    return _checkout(request, proof_handler)
+
+
+@csrf_protect
+def _checkout(request, proof_handler):
+    cart = CartService(request.user)
+    cart_items = list(cart.items())
+    total_price = cart.total()
 
     if request.method == "POST":
         form = DeliveryForm(request.POST, request.FILES)  # Include request.FILES for file uploads
-        if form.is_valid():
+        if proof_handler.too_large:
+            limit = settings.PAYMENT_PROOF_MAX_SIZE // (1024 * 1024)
+            messages.error(request, f"Payment proof must be smaller than {limit} MB.")
+        elif form.is_valid():
             order = form.save(commit=False)
             order.user = request.user
-            order.total_price = total_price
-            order.payment_proof = request.FILES.get('payment_proof')  # Save the uploaded file
-            order.save()
-
-            # Clear the cart after checkout
-            cart_items.delete()
-
-            return render(request, 'products/checkout_success.html', {'order': order, 'qr_code_path': qr_code_path})
+            payment_proof = request.FILES.get('payment_proof')
+            if payment_proof:
+                # Identical proofs share one file, named by their hash
+                store_payment_proof(order, payment_proof)
+
+            # Creates the order items, takes the stock and clears the cart
+            # in one transaction
+            try:
+                place_order(order)
+            except CheckoutError as exc:
+                messages.error(request, str(exc))
+                return redirect('cart')
+
+            return render(request, 'products/checkout_success.html', {
+                'order': order,
+                'payment_qr_url': payment_qr_url(order),
+            })
     else:
         form = DeliveryForm()
 
+    # Hold the cart's stock while the customer pays
+    hold_expires_at = hold_cart(request.user, cart_items)
+    short_items = [item for item in cart_items if item.available_stock < item.quantity]
+
     context = {
         'form': form,
         'cart_items': cart_items,
         'total_price': total_price,
-        'qr_code_path': qr_code_path,
+        'hold_expires_at': hold_expires_at,
+        'short_items': short_items,
     }
     return render(request, 'products/checkout.html', context)
 
@@ -229,24 +348,25 @@ def checkout(request):
 
 @login_required
 def remove_from_cart(request, item_id):
-    item = get_object_or_404(CartItem, id=item_id, user=request.user)
-    item.delete()
+    if not CartService(request.user).remove(item_id):
+        raise Http404("Cart item not found.")
     return redirect('cart')
 
 @login_required
 def update_cart_item(request, item_id):
-    item = get_object_or_404(CartItem, id=item_id, user=request.user)
+    cart = CartService(request.user)
     if request.method == "POST":
         action = request.POST.get('action')
-        print(f"Action received: {action}")  # Debug print
-        
-        if action == "increase":
-            item.quantity += 1
-            messages.success(request, f"Quantity increased to {item.quantity}")
-        elif action == "decrease" and item.quantity > 1:
-            item.quantity -= 1
-            messages.success(request, f"Quantity decreased to {item.quantity}")
-        item.save()
+        try:
+            if action == "increase":
+                quantity = cart.change_quantity(item_id, 1)
+                messages.success(request, f"Quantity increased to {quantity}")
+            elif action == "decrease":
+                quantity = cart.change_quantity(item_id, -1)
+                if quantity is not None:
+                    messages.success(request, f"Quantity decreased to {quantity}")
+        except CartItem.DoesNotExist:
+            raise Http404("Cart item not found.")
     return redirect('cart')  # Redirect back to the cart page
 
 @login_required(login_url='login')
@@ -261,70 +381,143 @@ def checkout_success(request, order_id):
 
     context = {
         'order': order,
-        'qr_code_path': f"{settings.MEDIA_URL}qr_codes/order_{order.id}.png",  # Update to your QR code path
+        'payment_qr_url': payment_qr_url(order),
     }
     return render(request, 'products/checkout_success.html', context)
 
+@login_required(login_url='login')
+def order_payment_qr(request, order_id, digest):
+    order = get_object_or_404(Order.objects.only('id', 'total_price'), id=order_id, user=request.user)
+    payload = payment_payload(order)
+    if digest != payload_digest(payload):
+        # The total changed since this URL was rendered
+        return redirect(payment_qr_url(order))
+    etag = f'"{digest}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(qr_png(payload), content_type='image/png')
+    # The URL names the payload, so what it serves never changes
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=60 * 60 * 24 * 365, immutable=True)
+    return response
+
 @login_required
 def profile(request):
-    user = request.user
-    orders = Order.objects.filter(user=user).order_by('-created_at')
-    reviews = Review.objects.filter(user=user).order_by('-created_at')
-    
-    context = {
-        'orders': orders,
-        'reviews': reviews,
-        'user': user
-    }
+    # Paginated orders and reviews, see products/orders.py
+    context = history_context(request)
+    context['user'] = request.user
     return render(request, 'users/profile.html', context)
 
+def _repeated_verification(verification, user):
+    if verification.user_id != user.id:
+        return JsonResponse({"success": False, "error": "Invalid payment details"}, status=400)
+    if verification.status == 'Verified':
+        return JsonResponse({"success": True, "order_id": verification.order_id})
+    if verification.status == 'Pending':
+        return JsonResponse({
+            "success": False,
+            "error": "Payment verification is already in progress"
+        }, status=409)
+    if verification.status in ('Unfulfilled', 'Refunded'):
+        return JsonResponse({
+            "success": False,
+            "error": "Your payment was received but the order could not be placed; it will be refunded."
+        }, status=409)
+    return JsonResponse({"success": False, "error": "Payment verification failed"})
+
+
 @csrf_exempt
-def verify_khalti(request):
-    if request.method == "POST":
-        token = request.POST.get("token")
-        amount = request.POST.get("amount")
-        
-        url = "https://khalti.com/api/v2/payment/verify/"
-        payload = {
-            "token": token,
-            "amount": amount
-        }
-        headers = {
-            "Authorization": f"Key {settings.KHALTI_SECRET_KEY}"
-        }
-        
-        response = requests.post(url, payload, headers=headers)
-        
-        if response.status_code == 200:
-            # Payment successful
-            # Create order and clear cart
-            order = Order.objects.create(
-                user=request.user,
-                total_price=float(amount) / 100,  # Convert paisa to rupees
-                payment_method="Khalti",
-                status="Processing"
-            )
-            
-            # Clear cart
-            CartItem.objects.filter(user=request.user).delete()
-            
-            return JsonResponse({
-                "success": True,
-                "order_id": order.id
-            })
-        
+async def verify_khalti(request):
+    # Async so a slow Khalti response doesn't hold a worker; each token is
+    # recorded once in PaymentVerification so client retries can't create
+    # duplicate orders. Stock is held before Khalti takes the money, and a
+    # payment that still can't become an order is kept as Unfulfilled.
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=400)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({"success": False, "error": "Please log in first."}, status=401)
+
+    token = request.POST.get("token", "").strip()
+    amount = request.POST.get("amount", "")
+    if not token or not amount.isdigit() or int(amount) <= 0:
+        return JsonResponse({"success": False, "error": "Invalid payment details"}, status=400)
+
+    # Repeated token: report the outcome of the first request
+    verification = await PaymentVerification.objects.filter(token=token).afirst()
+    if verification is not None and not claim_expired(verification):
+        return _repeated_verification(verification, user)
+
+    form = DeliveryForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse({
+            "success": False,
+            "error": "Please fill in your delivery details",
+            "errors": form.errors.get_json_data(),
+        }, status=400)
+
+    # The token only proves the customer paid ``amount``; the order is
+    # built from the whole cart, so the two must agree
+    total = await sync_to_async(CartService(user).total)()
+    if int(amount) != total * 100:
+        return JsonResponse({
+            "success": False,
+            "error": "Payment amount does not match your cart total"
+        }, status=400)
+
+    # Check and hold the stock before any money is taken
+    try:
+        await sync_to_async(hold_cart_for_payment)(user)
+    except CheckoutError as exc:
+        return JsonResponse({"success": False, "error": str(exc)}, status=409)
+
+    verification, claimed = await sync_to_async(claim_token)(token, user, int(amount))
+    if not claimed:
+        return _repeated_verification(verification, user)
+
+    try:
+        verified = await verify_token(token, int(amount))
+    except KhaltiUnavailable:
+        # Let the client retry the same token later
+        await verification.adelete()
+        return JsonResponse({
+            "success": False,
+            "error": "Payment service is unavailable, please try again"
+        }, status=503)
+
+    if not verified:
+        await sync_to_async(fail_verification)(verification, "Rejected by Khalti")
         return JsonResponse({
             "success": False,
             "error": "Payment verification failed"
         })
 
-    return JsonResponse({"error": "Invalid request"}, status=400)
+    try:
+        order = await sync_to_async(complete_order)(
+            verification,
+            form.cleaned_data["delivery_address"],
+            form.cleaned_data["phone_number"],
+        )
+    except CheckoutError as exc:
+        # The payment went through, so this needs a refund, not a retry
+        await sync_to_async(mark_unfulfilled)(verification, str(exc))
+        return JsonResponse({
+            "success": False,
+            "error": f"{exc} Your payment was received and will be refunded."
+        }, status=409)
+
+    return JsonResponse({
+        "success": True,
+        "order_id": order.id
+    })
 
 @login_required
 def bulk_delete_cart(request):
     if request.method == 'POST':
-        selected_items = request.POST.getlist('selected_items')
+        selected_items = [item for item in request.POST.getlist('selected_items') if item.isdigit()]
         if selected_items:
-            CartItem.objects.filter(id__in=selected_items, user=request.user).delete()
-            messages.success(request, f"{len(selected_items)} items removed from your cart.")
+            removed = CartService(request.user).remove_many(selected_items)
+            messages.success(request, f"{removed} items removed from your cart.")
     return redirect('cart')
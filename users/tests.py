@@ -1,3 +1,50 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import include, path
 
-# Create your tests here.
+from ecommerce.testing import QueryBudgetMixin
+from products.models import OutboundEmail
+
+# ecommerce.urls serves /profile/ from products.views.profile; list the
+# users URLs first so the users app's profile view can be measured too
+urlpatterns = [
+    path('', include('users.urls')),
+    path('', include('products.urls')),
+]
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('regular', email='regular@example.com', password='password123')
+
+    def test_login_page(self):
+        # Anonymous, and no session yet
+        self.assertQueryBudget('login', 0)
+
+    def test_login(self):
+        self.assertQueryBudget(
+            'login', 11, method='post', data={'username': 'regular', 'password': 'password123'}, status=302,
+        )
+
+    @override_settings(EMAIL_BACKEND='products.outbox.OutboxEmailBackend')
+    def test_password_reset_request(self):
+        # The user lookup and the outbox INSERT, which the test runner's
+        # locmem backend would otherwise hide
+        self.assertQueryBudget(
+            'password_reset', 2, method='post', data={'email': 'regular@example.com'}, status=302,
+        )
+        self.assertEqual(OutboundEmail.objects.get().to, ['regular@example.com'])
+
+    def test_register(self):
+        self.assertQueryBudget('register', 0)
+        # The user, then the profile the post_save signals create and save
+        self.assertQueryBudget('register', 6, method='post', data={
+            'username': 'newcomer', 'email': 'newcomer@example.com', 'first_name': 'New',
+            'last_name': 'Comer', 'password1': 'a-long-passphrase', 'password2': 'a-long-passphrase',
+        }, status=302)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    def test_profile(self):
+        self.client.force_login(self.user)
+        self.assertQueryBudget('profile', 5)
+        self.assertQueryBudget('profile', 4, method='post', data={'phone_number': '9800000000'}, status=302)
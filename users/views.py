@@ -4,7 +4,8 @@ from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from .forms import UserRegisterForm
-from products.models import UserProfile, Order, Review
+from products.models import UserProfile
+from products.orders import history_context
 from django.views.decorators.http import require_http_methods
 
 def register(request):
@@ -57,8 +58,6 @@ def logout_view(request):
 @login_required
 def profile(request):
     user = request.user
-    orders = Order.objects.filter(user=user).order_by('-created_at')
-    reviews = Review.objects.filter(user=user).order_by('-created_at')
     
     if request.method == 'POST':
         # Handle profile update
@@ -72,8 +71,5 @@ def profile(request):
         messages.success(request, 'Profile updated successfully!')
         return redirect('profile')
     
-    context = {
-        'orders': orders,
-        'reviews': reviews
-    }
+    context = history_context(request)
     return render(request, 'users/profile.html', context)